@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Measure harness overhead by running every wrapper, and run.py, against the mock server.
+
+Each wrapper runs in its own subprocess so its CPU time and peak RSS are not
+mixed with the mock servers or with other wrappers. Benchmarks whose data is
+not set up are reported as errors. Startup time of `run.py --help` and
+`run.py --list` is measured first, with the slowest imports behind it; pass
+`--baseline` with an earlier `--json` file to flag regressions.
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).parent
+
+
+def peak_rss_mb(usage) -> float:
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def start_mock(args) -> tuple:
+    command = [sys.executable, '-m', 'narrabench.mock_server', '--port', '0', '--latency', args.latency,
+               '--token-rate', str(args.token_rate), '--error-rate', str(args.error_rate)]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline().strip()
+    if not line.startswith("Listening on "):
+        process.kill()
+        raise RuntimeError(f"Mock server failed to start: {line!r}")
+    port = int(line.rsplit(':', 1)[1].split('/')[0])
+    return process, port
+
+
+def run_single(args):
+    """Worker mode: run one wrapper in this process and print its metrics as JSON."""
+    sys.path.insert(0, str(ROOT))
+    from run import load_wrapper
+    from narrabench.registry import discover_tasks
+    from narrabench.engine import Engine
+    from narrabench.journal import Journal
+
+    logging.getLogger().setLevel(logging.WARNING)
+    benchmark = next(b for b in discover_tasks(ROOT / "tasks") if b['name'] == args.single)
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    result = {'benchmark': args.single}
+    with Engine(concurrency=args.concurrency) as engine:
+        try:
+            wrapper = load_wrapper(benchmark['wrapper'])
+            loaded = time.perf_counter()
+            result['accuracy'] = wrapper.run_benchmark('mock', '127.0.0.1', args.port, '127.0.0.1', args.judge_port,
+                                                       engine=engine.bind(args.single), journal=Journal())
+        except Exception as e:
+            result['error'] = f"{type(e).__name__}: {e}"
+            loaded = time.perf_counter()
+        summary = engine.telemetry.summary(args.single)
+
+    result.update({
+        'wall_s': time.perf_counter() - wall,
+        'import_s': loaded - wall,
+        'cpu_s': time.process_time() - cpu,
+        'requests': summary['requests'],
+        'peak_rss_mb': peak_rss_mb(resource.getrusage(resource.RUSAGE_SELF)),
+    })
+    print(json.dumps(result))
+
+
+def import_times(command: list, top: int = 5) -> list:
+    """Return the `top` slowest top-level imports of `command` as (module, seconds), from `-X importtime`."""
+    completed = subprocess.run([sys.executable, '-X', 'importtime'] + command, cwd=ROOT, capture_output=True, text=True)
+    times = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = [part.strip() for part in line.split('|')]
+        if module == module.lstrip():
+            times.append((module, int(cumulative) / 1e6))
+    return sorted(times, key=lambda t: -t[1])[:top]
+
+
+def measure_startup(repeat: int = 3) -> list:
+    """Time `run.py --help` and `run.py --list`, keeping the fastest of `repeat` runs of each."""
+    measurements = []
+    for flag in ('--help', '--list'):
+        command = ['run.py', flag]
+        completed, wall, cpu, rss = min((run_child([sys.executable] + command) for _ in range(repeat)), key=lambda run: run[1])
+        measurements.append({'benchmark': f"run.py {flag}", 'wall_s': wall, 'cpu_s': cpu, 'peak_rss_mb': rss,
+                             'imports': import_times(command),
+                             **({} if completed.returncode == 0 else {'error': f"exit {completed.returncode}"})})
+    return measurements
+
+
+def compare(measurements: list, baseline: list, tolerance: float) -> list:
+    """Return (name, before, after) for every measurement whose wall time grew by more than `tolerance`."""
+    before = {m['benchmark']: m['wall_s'] for m in baseline if 'wall_s' in m}
+    return [
+        (m['benchmark'], before[m['benchmark']], m['wall_s'])
+        for m in measurements
+        if 'wall_s' in m and m['benchmark'] in before and m['wall_s'] > before[m['benchmark']] * (1 + tolerance)
+    ]
+
+
+def run_child(command: list) -> tuple:
+    """Run `command` and return its completed process, wall time, CPU time and peak RSS.
+
+    CPU and RSS come from this child's own resource usage (`os.wait4`), since
+    RUSAGE_CHILDREN's `ru_maxrss` is the largest of every child waited on so far.
+    """
+    with tempfile.TemporaryFile('w+') as stdout, tempfile.TemporaryFile('w+') as stderr:
+        wall = time.perf_counter()
+        process = subprocess.Popen(command, cwd=ROOT, stdout=stdout, stderr=stderr, text=True)
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - wall
+        process.returncode = os.waitstatus_to_exitcode(status)
+        stdout.seek(0)
+        stderr.seek(0)
+        completed = subprocess.CompletedProcess(command, process.returncode, stdout.read(), stderr.read())
+    return completed, wall, usage.ru_utime + usage.ru_stime, peak_rss_mb(usage)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark harness overhead against a local mock server')
+    parser.add_argument('--tasks', default=None, help='Comma-separated benchmarks to measure (default: all)')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--latency', default='fixed:0', help='Mock server latency distribution')
+    parser.add_argument('--token-rate', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--skip-run', action='store_true', help='Only measure the wrappers, not run.py end to end')
+    parser.add_argument('--json', default=None, help='Also write the measurements to this JSON file')
+    parser.add_argument('--baseline', default=None, help='JSON file of an earlier run; wall times slower by more than --tolerance are flagged')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative slowdown against --baseline (default: 0.2)')
+    parser.add_argument('--single', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--judge-port', type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args)
+        return
+
+    sys.path.insert(0, str(ROOT))
+    from narrabench.registry import discover_tasks
+    names = [b['name'] for b in discover_tasks(ROOT / "tasks")]
+    if args.tasks:
+        names = [n for n in names if n in args.tasks.split(',')]
+
+    measurements = measure_startup()
+    target, port = start_mock(args)
+    judge, judge_port = start_mock(args)
+    try:
+        for name in names:
+            completed, _, _, _ = run_child([sys.executable, __file__, '--single', name, '--port', str(port),
+                                            '--judge-port', str(judge_port), '--concurrency', str(args.concurrency)])
+            lines = completed.stdout.strip().splitlines()
+            if completed.returncode != 0 or not lines:
+                measurements.append({'benchmark': name, 'error': (completed.stderr.strip().splitlines() or ['crashed'])[-1]})
+                continue
+            measurements.append(json.loads(lines[-1]))
+
+        if not args.skip_run:
+            with tempfile.TemporaryDirectory() as tmp:
+                completed, wall, cpu, rss = run_child([
+                    sys.executable, 'run.py', '--model', 'mock', '--host', '127.0.0.1', '--port', str(port),
+                    '--judge-host', '127.0.0.1', '--judge-port', str(judge_port), '--concurrency', str(args.concurrency),
+                    '--no-cache', '--journal-dir', str(Path(tmp) / 'journal'), '--output', str(Path(tmp) / 'results.csv'),
+                    '--prompt-dir', str(Path(tmp) / 'prompts'), '--results-db', str(Path(tmp) / 'results.sqlite'),
+                    '--only', ','.join(names),
+                ])
+            measurements.append({'benchmark': 'run.py', 'wall_s': wall, 'cpu_s': cpu, 'peak_rss_mb': rss,
+                                 **({} if completed.returncode == 0 else {'error': f"exit {completed.returncode}"})})
+    finally:
+        target.terminate()
+        judge.terminate()
+
+    logger.info(f"{'Benchmark':<14} {'Requests':>9} {'Wall (s)':>9} {'Import (s)':>11} {'CPU (s)':>8} {'CPU ms/req':>11} {'Req/s':>8} {'RSS (MB)':>9}")
+    logger.info("-" * 86)
+    for m in measurements:
+        if 'wall_s' not in m:
+            logger.info(f"{m['benchmark']:<14} ERROR {m['error']}")
+            continue
+        requests = m.get('requests')
+        per_request = f"{1000 * m['cpu_s'] / requests:.2f}" if requests else "-"
+        throughput = f"{requests / m['wall_s']:.1f}" if requests else "-"
+        imported = f"{m['import_s']:.2f}" if 'import_s' in m else "-"
+        line = (f"{m['benchmark']:<14} {requests if requests is not None else '-':>9} {m['wall_s']:>9.2f} {imported:>11} "
+                f"{m['cpu_s']:>8.2f} {per_request:>11} {throughput:>8} {m['peak_rss_mb']:>9.1f}")
+        if 'error' in m:
+            line += f"  ({m['error']})"
+        logger.info(line)
+
+    for m in measurements:
+        if m.get('imports'):
+            logger.info(f"\nSlowest imports of {m['benchmark']}: " + ", ".join(f"{module} {seconds:.3f}s" for module, seconds in m['imports']))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(measurements, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(measurements, json.load(f), args.tolerance)
+        for name, before, after in regressions:
+            logger.info(f"REGRESSION {name}: {before:.2f}s -> {after:.2f}s")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
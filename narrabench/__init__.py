@@ -0,0 +1 @@
+"""Shared harness code used by run.py and the task wrappers."""
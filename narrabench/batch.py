@@ -0,0 +1,116 @@
+"""Offline batch mode: requests written as OpenAI batch-format JSONL, answers read back from a batch runner's output.
+
+Each request gets a `custom_id` of its benchmark run and a digest of the
+request itself, so exporting the same run twice gives the same ids, and an
+answer is matched to its request however the examples are ordered. The files
+follow the format of the OpenAI Batch API, which `vllm run-batch` also reads
+and writes:
+
+    {"custom_id": "tram-1f0c...", "method": "POST", "url": "/v1/chat/completions", "body": {...}}
+    {"id": "...", "custom_id": "tram-1f0c...", "response": {"status_code": 200, "body": {...}}, "error": null}
+"""
+
+import hashlib
+import json
+import logging
+from collections import Counter
+from pathlib import Path
+
+from openai.types.chat import ChatCompletion
+
+logger = logging.getLogger(__name__)
+
+ENDPOINT = "/v1/chat/completions"
+
+
+class Deferred(Exception):
+    """A request written to a batch file instead of being answered."""
+
+
+class BatchError(Exception):
+    """A request the batch runner failed, or that is missing from its output."""
+
+
+def request_digest(request: dict) -> str:
+    return hashlib.sha256(json.dumps(request, sort_keys=True, separators=(",", ":")).encode()).hexdigest()[:24]
+
+
+def custom_id(owner: str, request: dict) -> str:
+    return f"{owner or 'request'}-{request_digest(request)}"
+
+
+def batch_files(paths: list) -> list:
+    """Expand `paths` to the JSONL files they name, reading every `*.jsonl` in a directory."""
+    files = []
+    for path in map(Path, paths):
+        files.extend(sorted(path.glob("*.jsonl")) if path.is_dir() else [path])
+    return files
+
+
+class BatchExchange:
+    """Answers requests from batch output files and writes the others to batch input files.
+
+    `outputs` are batch runner output files (or directories of them). With an
+    `export_dir`, a request without an answer, or whose answer is an error, is
+    appended to `<export_dir>/<model>.jsonl` and raises `Deferred`; one file
+    per model, since a batch runner serves one model at a time. Without one it
+    raises `BatchError`. `answered` and `deferred` count requests by benchmark
+    run, `exported` counts distinct requests by batch file.
+    """
+
+    def __init__(self, outputs: list = (), export_dir: Path = None):
+        self.export_dir = Path(export_dir) if export_dir is not None else None
+        self.answers = {}
+        self.deferred = Counter()
+        self.answered = Counter()
+        self.exported = Counter()
+        self._digests = set()
+        self._files = {}
+
+        for path in batch_files(outputs):
+            with open(path, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.answers[entry["custom_id"].rsplit("-", 1)[-1]] = entry
+        if outputs:
+            logger.info(f"Batch: {len(self.answers)} answer(s) read from {', '.join(map(str, outputs))}")
+
+    def answer(self, owner: str, request: dict) -> ChatCompletion:
+        digest = request_digest(request)
+        entry = self.answers.get(digest)
+        error = self._error(entry)
+        if error is None:
+            self.answered[owner] += 1
+            return ChatCompletion.model_validate(entry["response"]["body"])
+        if self.export_dir is None:
+            raise BatchError(f"{custom_id(owner, request)}: {error}")
+
+        if digest not in self._digests:
+            self._digests.add(digest)
+            f = self._file(request.get("model", "model"))
+            f.write(json.dumps({"custom_id": custom_id(owner, request), "method": "POST", "url": ENDPOINT, "body": request}) + "\n")
+            self.exported[f.name] += 1
+        self.deferred[owner] += 1
+        raise Deferred(custom_id(owner, request))
+
+    @staticmethod
+    def _error(entry: dict):
+        if entry is None:
+            return "not in the batch output"
+        if entry.get("error"):
+            return f"batch runner error: {entry['error']}"
+        response = entry.get("response") or {}
+        if response.get("status_code", 200) != 200:
+            return f"batch runner returned status {response['status_code']}"
+        return None
+
+    def _file(self, model: str):
+        if model not in self._files:
+            self.export_dir.mkdir(parents=True, exist_ok=True)
+            self._files[model] = open(self.export_dir / f"{model.replace('/', '__')}.jsonl", 'w')
+        return self._files[model]
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
@@ -0,0 +1,105 @@
+"""Lazy access to benchmark data: only the rows a wrapper evaluates are materialized."""
+
+import csv
+import functools
+import json
+import re
+import threading
+from itertools import islice
+from pathlib import Path
+
+_SEPARATORS = re.compile(r'[\s,:]*')
+_NUMBER_CHARS = frozenset('0123456789.eE+-')
+
+
+def memoize(loader):
+    """Cache `loader`'s result per (positional) arguments for the life of the process.
+
+    Concurrent callers with the same arguments wait for the first one instead of
+    loading again, so a sweep over several models builds each benchmark's
+    examples once. Callers share the result and must not modify it.
+    """
+    results = {}
+    locks = {}
+    guard = threading.Lock()
+
+    @functools.wraps(loader)
+    def cached(*args):
+        with guard:
+            lock = locks.setdefault(args, threading.Lock())
+        with lock:
+            if args not in results:
+                results[args] = loader(*args)
+            return results[args]
+
+    return cached
+
+
+def head(dataset, n: int):
+    """Return the first `n` rows of a `datasets.Dataset`, still backed by its memory-mapped Arrow table."""
+    return dataset.select(range(min(n, len(dataset))))
+
+
+def read_delimited(path: Path, limit: int = None, delimiter: str = ',', where=None) -> list:
+    """Read up to `limit` rows of a CSV/TSV file as dicts, stopping once enough rows are read.
+
+    `where` filters rows before the limit is applied.
+    """
+    with open(path, 'r') as f:
+        rows = csv.DictReader(f, delimiter=delimiter)
+        if where is not None:
+            rows = filter(where, rows)
+        return list(islice(rows, limit))
+
+
+def stream_json(path: Path, chunk_size: int = 1 << 16):
+    """Yield the members of a top-level JSON array or object without loading the whole file.
+
+    Arrays yield their elements; objects yield `(key, value)` pairs.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer or buffer[0] not in '[{':
+            raise ValueError(f"{path} does not contain a JSON array or object")
+        is_object = buffer[0] == '{'
+        position = 1
+        eof = False
+        key = None
+
+        while True:
+            position = _SEPARATORS.match(buffer, position).end()
+            if position < len(buffer) and buffer[position] in ']}':
+                return
+
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                # A number cut off by the end of the buffer still decodes (`1.` as `1`),
+                # so a value is only complete once something that cannot continue it follows.
+                complete = eof or (end < len(buffer) and buffer[end] not in _NUMBER_CHARS)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+
+            if not complete:
+                buffer = buffer[position:]
+                chunk = f.read(max(chunk_size, len(buffer)))
+                eof = not chunk
+                buffer += chunk
+                position = 0
+                continue
+
+            position = end
+            if not is_object:
+                yield value
+            elif key is None:
+                key = value
+            else:
+                yield key, value
+                key = None
+
+
+def read_json(path: Path, limit: int = None) -> list:
+    """Return up to `limit` members of a top-level JSON array or object, as `stream_json` yields them."""
+    return list(islice(stream_json(path), limit))
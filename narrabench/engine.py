@@ -0,0 +1,608 @@
+"""Async bounded-concurrency execution of chat completion requests."""
+
+import asyncio
+import concurrent.futures
+import contextlib
+import copy
+import inspect
+import email.utils
+import logging
+import math
+import random
+import threading
+import time
+from collections import deque
+
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI, InternalServerError, RateLimitError
+from openai.types.chat import ChatCompletion
+
+from narrabench.batch import BatchError, BatchExchange, Deferred
+from narrabench.cache import ResponseCache
+from narrabench.telemetry import Telemetry
+from narrabench.transport import Transport
+
+logger = logging.getLogger(__name__)
+
+# Request settings for scoring a closed set of answers from one token's logprobs.
+LOGPROB_PARAMS = {"max_tokens": 1, "logprobs": True, "top_logprobs": 20}
+
+
+def message_content(result) -> str:
+    """Return the message text of a completion, re-raising a failed request's exception."""
+    if isinstance(result, BaseException):
+        raise result
+    return result.choices[0].message.content
+
+
+def option_probabilities(result, options: list) -> dict:
+    """Return the probability of each of `options` as the answer, from the first token's top logprobs.
+
+    A token counts towards an option when, stripped and lowercased, it starts
+    that option, so `" A"` counts for `A` and `"sad"` for `sadness`; a
+    one-letter token only counts for a one-letter option. A token that starts
+    several options (`"ne"` for negative and neutral) splits its probability
+    evenly between them, so a tokenizer that splits labels keeps their mass.
+    Probabilities are renormalized over the options; if no top token matches
+    any option they are all 0.
+    """
+    if isinstance(result, BaseException):
+        raise result
+    logprobs = result.choices[0].logprobs
+    if logprobs is None or not logprobs.content:
+        raise ValueError("Response has no logprobs; the server must support logprobs for this scoring mode")
+
+    mass = dict.fromkeys(options, 0.0)
+    for candidate in logprobs.content[0].top_logprobs or [logprobs.content[0]]:
+        token = candidate.token.strip().lower()
+        matches = [option for option in options if len(token) >= min(2, len(option)) and option.lower().startswith(token)]
+        for option in matches:
+            mass[option] += math.exp(candidate.logprob) / len(matches)
+    total = sum(mass.values())
+    return {option: p / total if total else 0.0 for option, p in mass.items()}
+
+
+def top_option(probabilities: dict):
+    """The most probable option, or None if no option was seen or the top options tie.
+
+    A tie means the answer cannot be told apart from the logprobs, e.g. only a
+    token shared by two labels was seen; the example is then scored as wrong
+    with no answer rather than given to whichever option comes first.
+    """
+    ranked = sorted(probabilities.values(), reverse=True)
+    if not ranked or ranked[0] <= 0 or (len(ranked) > 1 and math.isclose(ranked[0], ranked[1])):
+        return None
+    return max(probabilities, key=probabilities.get)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed request may succeed if sent again: connection errors, timeouts, 408, 409, 429 and 5xx."""
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code in (408, 409, 429) or error.status_code >= 500)
+
+
+def is_overload(error: Exception) -> bool:
+    """Whether a failure signals that the server is overloaded rather than that the request is bad."""
+    return isinstance(error, (APIConnectionError, RateLimitError, InternalServerError))
+
+
+def retry_after(error: Exception):
+    """Seconds the server asked us to wait in a `Retry-After` (or `retry-after-ms`) header, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        if "retry-after" not in headers:
+            return None
+        # Not a number, so an HTTP date; a malformed one falls back to the usual backoff.
+        try:
+            date = email.utils.parsedate_to_datetime(headers["retry-after"])
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, date.timestamp() - time.time())
+    return None
+
+
+def prefix_key(request: dict) -> tuple:
+    """Return the part of a request shared with others that differ only in the last message, and its length."""
+    shared = tuple((m["role"], str(m["content"])) for m in request["messages"][:-1])
+    return (request.get("model"), shared), sum(len(content) for _, content in shared)
+
+
+class Budget:
+    """Concurrency budget for one endpoint, handed out round-robin between benchmarks.
+
+    Each benchmark waits in its own queue, so a benchmark that submits a large
+    batch cannot hold back the first request of another benchmark on the same
+    endpoint.
+
+    With `adaptive`, the number of slots in use is capped by `limit`, which moves
+    between 1 and `capacity` AIMD-style: it grows by one slot per window of
+    successful requests and is halved when the server reports overload, or cut
+    by a tenth when latency climbs past `latency_tolerance` times the lowest
+    latency seen. Each cut waits at least one round trip after the previous one.
+    """
+
+    def __init__(self, capacity: int, adaptive: bool = False, latency_tolerance: float = 3.0):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.limit = float(capacity)
+        self.adaptive = adaptive
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self._queues = {}
+        self._turns = deque()
+        self._latency = None
+        self._baseline = None
+        self._last_cut = 0.0
+
+    def _open(self) -> bool:
+        return self.in_flight < (int(self.limit) if self.adaptive else self.capacity)
+
+    async def acquire(self, owner: str):
+        if self._open() and not self._turns:
+            self.in_flight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        if owner not in self._queues:
+            self._queues[owner] = deque()
+            self._turns.append(owner)
+        self._queues[owner].append(waiter)
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def feedback(self, latency: float = None, overloaded: bool = False):
+        """Adjust `limit` after a request: `latency` of a success, or `overloaded` for an overload failure."""
+        if not self.adaptive:
+            return
+        now = time.monotonic()
+        if overloaded:
+            self._cut(now, 0.5)
+            return
+        if latency is None:
+            return
+        self._latency = latency if self._latency is None else 0.9 * self._latency + 0.1 * latency
+        self._baseline = self._latency if self._baseline is None else min(self._baseline, self._latency)
+        if self._latency > self.latency_tolerance * self._baseline:
+            self._cut(now, 0.9)
+        else:
+            self.limit = min(self.capacity, self.limit + 1 / self.limit)
+            self._wake()
+
+    def _cut(self, now: float, factor: float):
+        if now - self._last_cut < (self._latency or 0.0):
+            return
+        self._last_cut = now
+        self.limit = max(1.0, self.limit * factor)
+
+    def _wake(self):
+        while self._open() and self._turns:
+            owner = self._turns.popleft()
+            queue = self._queues[owner]
+            waiter = queue.popleft()
+            if queue:
+                self._turns.append(owner)
+            else:
+                del self._queues[owner]
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+
+class Replica:
+    """One server behind an endpoint, with its load and health."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.in_flight = 0
+        self.requests = 0
+        self.healthy = True
+
+
+class ReplicaSet:
+    """Replicas serving one endpoint, picked least-loaded first.
+
+    A replica whose request fails with a connection error or a 5xx status is
+    taken out of rotation and probed every `cooldown` seconds (doubling up to
+    `max_cooldown`) until its `/models` route answers again. While every
+    replica is out, requests still go to the least-loaded one rather than
+    failing outright.
+    """
+
+    def __init__(self, urls: list, cooldown: float = 5.0, max_cooldown: float = 60.0):
+        if not urls:
+            raise ValueError("at least one replica is required")
+        self.replicas = [Replica(url) for url in urls]
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._probes = set()
+
+    def __len__(self):
+        return len(self.replicas)
+
+    def acquire(self) -> Replica:
+        candidates = [r for r in self.replicas if r.healthy] or self.replicas
+        replica = min(candidates, key=lambda r: (r.in_flight, r.requests))
+        replica.in_flight += 1
+        replica.requests += 1
+        return replica
+
+    def release(self, replica: Replica, error: Exception = None, probe=None):
+        replica.in_flight -= 1
+        if replica.healthy and isinstance(error, (APIConnectionError, InternalServerError)) and len(self.replicas) > 1:
+            replica.healthy = False
+            logger.warning(f"    Replica {replica.url} out of rotation: {type(error).__name__}")
+            task = asyncio.ensure_future(self._recover(replica, probe))
+            self._probes.add(task)
+            task.add_done_callback(self._probes.discard)
+
+    def close(self):
+        for task in list(self._probes):
+            task.cancel()
+
+    async def _recover(self, replica: Replica, probe):
+        delay = self.cooldown
+        while not replica.healthy:
+            await asyncio.sleep(delay)
+            try:
+                await probe(replica.url)
+            except Exception:
+                delay = min(delay * 2, self.max_cooldown)
+                continue
+            replica.healthy = True
+            logger.info(f"    Replica {replica.url} back in rotation")
+
+
+class Engine:
+    """Sends chat completion requests from any thread through one shared event loop.
+
+    Every endpoint (base URL) has its own `Budget`; endpoints without an explicit
+    entry in `budgets` get `concurrency` slots. Use `bind` to get a view of the
+    engine labelled with a benchmark name; all views share the same budgets.
+    With a `cache`, requests it already holds are answered without a slot.
+
+    Requests in one `complete` call whose messages before the last one add up
+    to at least `prefix_threshold` characters are grouped by that prefix and
+    dispatched together. The first request of each group is sent alone so the
+    server has the prefix cached before the rest of the group arrives.
+
+    Requests that fail with a retryable error are sent again, possibly to
+    another replica, up to `max_retries` times with exponential backoff and
+    full jitter (or after the server's `Retry-After`), without holding a slot
+    while waiting. With `adaptive`, each endpoint's budget adapts to overload
+    (see `Budget`). Requests that still fail are kept in `dead_letters`, by
+    benchmark.
+
+    `replicas` maps an endpoint to the URLs of the servers behind it; each
+    request goes to the least-loaded healthy one (see `ReplicaSet`). The cache
+    and budget stay keyed by the endpoint, so replicas are interchangeable.
+    Keys of `replicas` and `budgets` may also be `(base_url, model)` pairs,
+    which take precedence for requests to that model, so models that share a
+    first server keep their own replicas and budgets.
+
+    Every call is recorded in `telemetry`. With `stream`, responses are
+    streamed so that time to first token can be measured.
+
+    With a `batch` exchange nothing is sent: requests are answered from batch
+    output files or written to a batch file (see `narrabench.batch`).
+
+    Every endpoint and replica is reached through one `transport`, a shared
+    connection pool (see `narrabench.transport`); by default it allows as many
+    connections as the budgets allow requests. The engine closes it.
+    """
+
+    def __init__(self, concurrency: int = 64, budgets: dict = None, cache: ResponseCache = None, prefix_threshold: int = 1024,
+                 telemetry: Telemetry = None, stream: bool = False, replicas: dict = None, max_retries: int = 4,
+                 backoff: float = 0.5, max_backoff: float = 30.0, adaptive: bool = True, batch: BatchExchange = None,
+                 transport: Transport = None):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.concurrency = concurrency
+        self.benchmark = None
+        self.cache = cache
+        self.prefix_threshold = prefix_threshold
+        self.telemetry = telemetry or Telemetry()
+        self.stream = stream
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.adaptive = adaptive
+        self.batch = batch
+        self.transport = transport or Transport(pool_size=concurrency + sum((budgets or {}).values()))
+        self.dead_letters = {}
+        self._budgets = {url: Budget(capacity, adaptive=adaptive) for url, capacity in (budgets or {}).items()}
+        self._replicas = {url: ReplicaSet(urls) for url, urls in (replicas or {}).items()}
+        self._clients = {}
+        self._futures = set()
+        self._cancelled = threading.Event()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="narrabench-engine", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def bind(self, benchmark: str) -> "Engine":
+        """Return a view of this engine whose requests are scheduled under `benchmark`."""
+        view = copy.copy(self)
+        view.benchmark = benchmark
+        return view
+
+    def cancel(self):
+        """Cancel every request in flight and make callers of `run`, now and later, raise `CancelledError`."""
+        self._cancelled.set()
+        for future in list(self._futures):
+            future.cancel()
+        if self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._cancel_tasks)
+
+    def _cancel_tasks(self):
+        for task in asyncio.all_tasks(self._loop):
+            task.cancel()
+
+    def close(self):
+        if not self._loop.is_running():
+            return
+        # Wake every thread still waiting in `run` before the loop stops, or it would wait forever.
+        self.cancel()
+        asyncio.run_coroutine_threadsafe(self._close_clients(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def complete(self, base_url: str, requests: list, log_every: int = 0, on_result=None, stop=None) -> list:
+        """Send every request and return the results in request order.
+
+        Each request is a dict of keyword arguments for `chat.completions.create`.
+        A request that fails yields its exception in place of a response.
+        `on_result(index, result)` is called on the engine thread as each request
+        finishes, in completion order. Once `stop()` returns true, requests not
+        yet sent are skipped and yield None, as do requests deferred to a batch
+        file.
+        """
+        if not requests:
+            return []
+        return self.run(self.map(base_url, requests, handle=on_result, log_every=log_every, stop=stop))
+
+    def run(self, coroutine):
+        """Run `coroutine` on the engine loop from a non-engine thread and return its result.
+
+        Raises `concurrent.futures.CancelledError` once the engine is cancelled or closed.
+        """
+        if self._cancelled.is_set():
+            coroutine.close()
+            raise concurrent.futures.CancelledError("engine cancelled")
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        self._futures.add(future)
+        try:
+            return future.result()
+        finally:
+            self._futures.discard(future)
+
+    def capacity(self, base_url: str, model: str = None) -> int:
+        return self._budget(self._endpoint(base_url, model)).capacity
+
+    def _endpoint(self, base_url: str, model: str = None):
+        """The key of the budget and replicas behind `model` at `base_url`: the pair when one is configured, else the URL."""
+        pair = (base_url, model)
+        return pair if pair in self._replicas or pair in self._budgets else base_url
+
+    def _client(self, base_url: str) -> AsyncOpenAI:
+        if base_url not in self._clients:
+            self._clients[base_url] = AsyncOpenAI(base_url=base_url, api_key="dummy", max_retries=0,
+                                                  timeout=self.transport.timeout, http_client=self.transport.client)
+        return self._clients[base_url]
+
+    def _replica_set(self, endpoint) -> ReplicaSet:
+        if endpoint not in self._replicas:
+            self._replicas[endpoint] = ReplicaSet([endpoint[0] if isinstance(endpoint, tuple) else endpoint])
+        return self._replicas[endpoint]
+
+    async def _probe(self, url: str):
+        await self._client(url).with_options(max_retries=0, timeout=5.0).models.list()
+
+    def _budget(self, endpoint) -> Budget:
+        if endpoint not in self._budgets:
+            self._budgets[endpoint] = Budget(self.concurrency, adaptive=self.adaptive)
+        return self._budgets[endpoint]
+
+    async def _close_clients(self):
+        for replicas in self._replicas.values():
+            replicas.close()
+        self._clients.clear()
+        await self.transport.aclose()
+        await self._loop.shutdown_default_executor()
+
+    def _dispatch_groups(self, requests: list) -> list:
+        """Split request indices into prefix groups, in order of each group's first request."""
+        groups = {}
+        for index, request in enumerate(requests):
+            key, length = prefix_key(request)
+            if self.prefix_threshold <= 0 or length < self.prefix_threshold:
+                key = None
+            groups.setdefault(key, []).append(index)
+        return [(key is not None, indices) for key, indices in groups.items()]
+
+    async def map(self, base_url: str, requests: list, handle=None, log_every: int = 0, stop=None) -> list:
+        """Send every request on the engine loop and return the results in request order.
+
+        `handle(index, result)` is called as each request finishes and may be a
+        coroutine function; the request counts as done once it returns. With a
+        `stop` predicate, no more requests than the endpoint's capacity are
+        started at once, and each checks `stop()` just before it is sent.
+        """
+        prefix = f"{self.benchmark}: " if self.benchmark else ""
+        done = 0
+        window = asyncio.Semaphore(self.capacity(base_url, requests[0].get("model"))) if stop is not None and requests else contextlib.nullcontext()
+
+        async def dispatch(index, primed=None):
+            nonlocal done
+            if primed is not None:
+                await primed
+            async with window:
+                if stop is not None and stop():
+                    return None
+                try:
+                    result = await self.send(base_url, requests[index])
+                except Deferred:
+                    return None
+                except Exception as e:
+                    result = e
+
+                if handle is not None:
+                    try:
+                        handled = handle(index, result)
+                        if inspect.isawaitable(handled):
+                            await handled
+                    except Exception:
+                        logger.exception(f"    {prefix}result callback failed")
+
+            done += 1
+            if log_every and done % log_every == 0:
+                logger.info(f"    {prefix}{done}/{len(requests)}")
+            return result
+
+        tasks = {}
+        for shared, indices in self._dispatch_groups(requests):
+            if shared and len(indices) > 1:
+                primer = asyncio.ensure_future(dispatch(indices[0]))
+                tasks[indices[0]] = primer
+                for index in indices[1:]:
+                    tasks[index] = asyncio.ensure_future(dispatch(index, primed=primer))
+            else:
+                for index in indices:
+                    tasks[index] = asyncio.ensure_future(dispatch(index))
+
+        return await asyncio.gather(*(tasks[index] for index in range(len(requests))))
+
+    async def send(self, base_url: str, request: dict):
+        """Send one request on the engine loop, going through the cache and the endpoint's budget."""
+        if self.batch is not None:
+            try:
+                return self.batch.answer(self.benchmark or "", request)
+            except BatchError as e:
+                self.dead_letters.setdefault(self.benchmark or "", []).append({
+                    "endpoint": base_url, "request": request, "error": f"{type(e).__name__}: {e}", "attempts": 0,
+                })
+                raise
+        endpoint = self._endpoint(base_url, request.get("model"))
+        return await self._send(self._replica_set(endpoint), self._budget(endpoint), self.benchmark or "", base_url, request)
+
+    async def _send(self, replicas: ReplicaSet, budget: Budget, owner: str, base_url: str, request: dict):
+        started = time.time()
+        clock = time.perf_counter()
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(base_url, request)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.telemetry.record(owner, base_url, started, latency=time.perf_counter() - clock, cache_hit=True)
+                return cached
+
+        for attempt in range(self.max_retries + 1):
+            clock = time.perf_counter()
+            await budget.acquire(owner)
+            queued = time.perf_counter() - clock
+            replica = replicas.acquire()
+            client = self._client(replica.url)
+            ttft = None
+            error = None
+            sent = time.perf_counter()
+            try:
+                with self.transport.track() as wire:
+                    if self.stream:
+                        response, ttft = await self._stream(client, request, sent)
+                    else:
+                        response = await client.chat.completions.create(**request)
+            except Exception as e:
+                error = e
+            finally:
+                latency = time.perf_counter() - sent
+                replicas.release(replica, error, probe=self._probe)
+                budget.feedback(latency=latency if error is None else None, overloaded=error is not None and is_overload(error))
+                budget.release()
+
+            if error is None:
+                self.telemetry.record(owner, base_url, started, queued=queued, latency=latency, ttft=ttft,
+                                      usage=response.usage, attempt=attempt, replica=replica.url, reused=wire.reused, socket_wait=wire.wait)
+                break
+
+            final = attempt == self.max_retries or not is_retryable(error)
+            self.telemetry.record(owner, base_url, started, queued=queued, latency=latency, attempt=attempt,
+                                  error=type(error).__name__, replica=replica.url, final=final, reused=wire.reused, socket_wait=wire.wait)
+            if final:
+                self.dead_letters.setdefault(owner, []).append({
+                    "endpoint": base_url, "request": request, "error": f"{type(error).__name__}: {error}", "attempts": attempt + 1,
+                })
+                raise error
+            delay = retry_after(error)
+            if delay is None:
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            await asyncio.sleep(min(delay, self.max_backoff))
+            started = time.time()
+
+        if key is not None:
+            self.cache.put(key, response)
+        return response
+
+    async def _stream(self, client: AsyncOpenAI, request: dict, sent: float) -> tuple:
+        """Stream a completion and reassemble it, returning it with the time to its first token."""
+        stream = await client.chat.completions.create(**request, stream=True, stream_options={"include_usage": True})
+        ttft = None
+        first = None
+        usage = None
+        choices = {}
+
+        async for chunk in stream:
+            first = first or chunk
+            if chunk.usage is not None:
+                usage = chunk.usage.model_dump()
+            for delta in chunk.choices:
+                choice = choices.setdefault(delta.index, {"index": delta.index, "content": [], "logprobs": [], "finish_reason": None})
+                if delta.delta.content:
+                    if ttft is None:
+                        ttft = time.perf_counter() - sent
+                    choice["content"].append(delta.delta.content)
+                if delta.logprobs is not None and delta.logprobs.content:
+                    choice["logprobs"].extend(item.model_dump() for item in delta.logprobs.content)
+                if delta.finish_reason is not None:
+                    choice["finish_reason"] = delta.finish_reason
+
+        response = ChatCompletion.model_validate({
+            "id": first.id if first else "",
+            "object": "chat.completion",
+            "created": first.created if first else 0,
+            "model": first.model if first else request.get("model", ""),
+            "choices": [
+                {
+                    "index": choice["index"],
+                    "message": {"role": "assistant", "content": "".join(choice["content"])},
+                    "logprobs": {"content": choice["logprobs"]} if choice["logprobs"] else None,
+                    "finish_reason": choice["finish_reason"] or "stop",
+                }
+                for choice in sorted(choices.values(), key=lambda c: c["index"])
+            ],
+            "usage": usage,
+        })
+        return response, ttft
@@ -0,0 +1,211 @@
+"""Fetch benchmark sources: cached, resumable, checksum-verified downloads unpacked selectively.
+
+A task declares its source in the `[source]` table of its `task.toml`:
+
+    [source]
+    url = "https://github.com/owner/repo/archive/refs/heads/main.zip"
+    root = "repo-main"           # top-level folder inside the archive
+    include = ["data/test.csv"]  # files or folders the wrapper needs (default: everything)
+    sha256 = "..."               # optional; verified when present
+
+A task without a pinned `sha256` trusts the archive it gets on first setup:
+its digest is recorded in `<dest>/.source.json`, and any later fetch of the
+same URL into that folder must match it.
+
+Archives are kept in a download cache (`NARRABENCH_DOWNLOAD_CACHE`), so
+re-running setup or setting up another checkout does not download them again.
+A mirror directory (`NARRABENCH_MIRROR`) laid out like the cache is tried
+before the network, and `file://` URLs are supported, so setup can run offline.
+"""
+
+import hashlib
+import http.client
+import json
+import logging
+import os
+import shutil
+import time
+import tomllib
+import urllib.error
+import urllib.request
+import zipfile
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / ".cache" / "narrabench" / "downloads"
+MARKER = ".source.json"
+CHUNK_SIZE = 1 << 20
+
+
+def cache_name(url: str) -> str:
+    """File name of `url` in the download cache and in mirrors: a URL hash plus the URL's last path segment."""
+    basename = url.rstrip('/').rsplit('/', 1)[-1] or "download"
+    return f"{hashlib.sha256(url.encode()).hexdigest()[:12]}-{basename}"
+
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _verify(path: Path, url: str, sha256: str = None) -> bool:
+    if sha256 is None:
+        return True
+    actual = sha256_file(path)
+    if actual != sha256:
+        logger.warning(f"    Checksum mismatch for {url}: expected {sha256}, got {actual}")
+        return False
+    return True
+
+
+def _transfer(url: str, part: Path):
+    """Append the rest of `url` to `part`, asking the server to resume from the bytes already there."""
+    offset = part.stat().st_size if part.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset and url.startswith(("http://", "https://")) else {}
+    try:
+        response = urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=60)
+    except urllib.error.HTTPError as e:
+        if e.code == 416:
+            return
+        raise
+    with response:
+        if offset and getattr(response, 'status', None) != 206:
+            offset = 0
+        expected = response.headers.get("Content-Length")
+        with open(part, 'ab' if offset else 'wb') as f:
+            f.truncate(offset)
+            shutil.copyfileobj(response, f, CHUNK_SIZE)
+            received = f.tell() - offset
+    if expected is not None and received < int(expected):
+        raise ConnectionError(f"connection closed after {received} of {expected} bytes")
+
+
+def download(url: str, cache_dir: Path = None, sha256: str = None, mirror: Path = None, attempts: int = 5) -> Path:
+    """Return the cached copy of `url`, downloading it if needed.
+
+    Interrupted downloads continue from the partial file, retried up to
+    `attempts` times with exponential backoff. A copy that does not match
+    `sha256` is discarded.
+    """
+    cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = cache_dir / cache_name(url)
+    if path.exists():
+        if _verify(path, url, sha256):
+            return path
+        path.unlink()
+
+    if mirror is not None and (Path(mirror) / path.name).exists():
+        logger.info(f"    Copying {url} from mirror {mirror}")
+        partial = path.with_name(f"{path.name}.{os.getpid()}.copy")
+        shutil.copyfile(Path(mirror) / path.name, partial)
+        if not _verify(partial, url, sha256):
+            partial.unlink()
+            raise ValueError(f"Mirror copy of {url} failed checksum verification")
+        os.replace(partial, path)
+        return path
+
+    part = path.with_name(path.name + ".part")
+    logger.info(f"    Downloading {url}{' (resuming)' if part.exists() else ''}")
+    for attempt in range(attempts):
+        try:
+            _transfer(url, part)
+            break
+        except (urllib.error.URLError, http.client.HTTPException, ConnectionError, TimeoutError) as e:
+            if attempt == attempts - 1:
+                raise
+            logger.warning(f"    Download of {url} interrupted ({e}), retrying")
+            time.sleep(2 ** attempt)
+
+    if not _verify(part, url, sha256):
+        part.unlink()
+        raise ValueError(f"Download of {url} failed checksum verification")
+    os.replace(part, path)
+    return path
+
+
+def _included(relative: str, include: list) -> bool:
+    return not include or any(relative == p.rstrip('/') or relative.startswith(p.rstrip('/') + '/') for p in include)
+
+
+def extract(archive_path: Path, dest: Path, root: str = "", include: list = None) -> int:
+    """Unpack the members of a zip archive under `root` into `dest`, limited to the `include` paths.
+
+    Files already present with the right size are skipped, so an interrupted
+    extraction picks up where it stopped. Returns the number of files written.
+    """
+    dest = Path(dest)
+    prefix = f"{root.strip('/')}/" if root else ""
+    include = include or []
+    matched = set()
+    written = 0
+
+    with zipfile.ZipFile(archive_path) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not info.filename.startswith(prefix):
+                continue
+            relative = info.filename[len(prefix):]
+            if not _included(relative, include):
+                continue
+            matched.update(p for p in include if _included(relative, [p]))
+
+            target = (dest / relative).resolve()
+            if not target.is_relative_to(dest.resolve()):
+                raise ValueError(f"Archive member {info.filename} would be written outside {dest}")
+            if target.exists() and target.stat().st_size == info.file_size:
+                continue
+
+            target.parent.mkdir(parents=True, exist_ok=True)
+            partial = target.with_name(target.name + ".partial")
+            with archive.open(info) as src, open(partial, 'wb') as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+            os.replace(partial, target)
+            written += 1
+
+    for missing in sorted(set(include) - matched):
+        logger.warning(f"    {archive_path.name}: nothing under {missing!r} in the archive")
+    return written
+
+
+def fetch_task(task_dir: Path, cache_dir: Path = None, mirror: Path = None) -> Path:
+    """Download and unpack the `[source]` of a task into `<task>-original`, unless it is already there."""
+    task_dir = Path(task_dir)
+    with open(task_dir / "task.toml", 'rb') as f:
+        source = tomllib.load(f)["source"]
+    cache_dir = cache_dir or os.environ.get("NARRABENCH_DOWNLOAD_CACHE") or None
+    mirror = mirror or os.environ.get("NARRABENCH_MIRROR") or None
+
+    dest = task_dir / source.get("dest", f"{task_dir.name}-original")
+    include = source.get("include", [])
+    wanted = {"url": source["url"], "root": source.get("root", ""), "include": include}
+    marker = dest / MARKER
+
+    recorded = json.loads(marker.read_text()) if marker.exists() else {}
+    if marker.exists() and {k: v for k, v in recorded.items() if k in wanted} == wanted:
+        logger.info(f"    {task_dir.name}: already set up")
+        return dest
+    if not marker.exists() and include and all((dest / p).exists() for p in include):
+        logger.info(f"    {task_dir.name}: already set up (no source record)")
+        return dest
+
+    sha256 = source.get("sha256")
+    if sha256 is None and recorded.get("url") == source["url"]:
+        sha256 = recorded.get("sha256")
+    try:
+        archive = download(source["url"], cache_dir=cache_dir, sha256=sha256, mirror=mirror)
+    except ValueError as e:
+        if sha256 is None or source.get("sha256") is not None:
+            raise
+        raise ValueError(f"{task_dir.name}: {source['url']} no longer matches the sha256 recorded in {marker} when it was "
+                         f"first set up; pin a sha256 in task.toml, or delete {dest} to accept the new archive") from e
+    if source.get("sha256") is None:
+        logger.info(f"    {task_dir.name}: no sha256 pinned in task.toml; downloaded archive has sha256 = \"{sha256_file(archive)}\"")
+
+    written = extract(archive, dest, root=wanted["root"], include=include)
+    marker.write_text(json.dumps({**wanted, "sha256": sha256_file(archive)}))
+    logger.info(f"    {task_dir.name}: extracted {written} file(s) into {dest}")
+    return dest
@@ -0,0 +1,61 @@
+"""Append-only per-example record of a benchmark run, used to resume after interruption."""
+
+import json
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    """Scored examples of one benchmark run, keyed by example id.
+
+    With a `path`, each record is appended to a JSONL file as soon as it is
+    scored. When `resume` is set, records already in the file are loaded so the
+    wrapper can skip those examples; otherwise the file is started afresh.
+    Without a `path` the journal only lives in memory.
+    """
+
+    def __init__(self, path: Path = None, resume: bool = False):
+        self.path = Path(path) if path is not None else None
+        self.records = {}
+        self._file = None
+
+        if self.path is None:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        torn = False
+        if resume and self.path.exists():
+            with open(self.path, 'r') as f:
+                for line in f:
+                    torn = not line.endswith("\n")
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.records[record['id']] = record
+            logger.info(f"    {self.path.stem}: resuming with {len(self.records)} journaled example(s)")
+
+        self._file = open(self.path, 'a' if resume else 'w')
+        if torn:
+            self._file.write("\n")
+
+    def __contains__(self, example_id: str) -> bool:
+        return example_id in self.records
+
+    def record(self, example_id: str, response: str, verdict):
+        record = {'id': example_id, 'response': response, 'verdict': verdict}
+        self.records[example_id] = record
+        if self._file is not None:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+
+    def verdicts(self, example_ids: list) -> list:
+        """Return the verdicts of the journaled examples among `example_ids`, in that order."""
+        return [self.records[i]['verdict'] for i in example_ids if i in self.records]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,259 @@
+"""Stand-in OpenAI-compatible chat completions server for profiling and testing the harness offline.
+
+Run it with `python -m narrabench.mock_server --port 11434`. Answers are canned
+per task (matched on the prompt text), latency is drawn from a configurable
+distribution, completion tokens are paced at `--token-rate`, and a fraction of
+requests can be failed on purpose.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ANSWERS = [
+    ("Answer only: YES or NO", "YES"),
+    ("Jane Austen's novels", "Emma Woodhouse"),
+    ("Answer with only the letter", "A"),
+    ("You should answer Yes or No", "Yes"),
+    ("'emotion' (one of", '{"emotion": "joy", "sentiment": "positive"}'),
+    ("What emotion does this express", "joy"),
+    ("What is the sentiment", "positive"),
+    ("temporal reasoning questions", '{"explanation": "E1 holds at that time.", "answer": "E1"}'),
+    ("just the name(s)", "Alice"),
+    ("event log", "yes"),
+]
+
+ALTERNATIVE_TOKENS = ["A", "B", "C", "Yes", "No", "joy", "sadness", "anger", "positive", "negative", "neutral"]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def parse_latency(spec: str):
+    """Return a sampler for `fixed:S`, `uniform:LO,HI`, `exponential:MEAN` or `lognormal:MEDIAN,SIGMA` (seconds)."""
+    kind, _, params = spec.partition(':')
+    values = [float(v) for v in params.split(',')] if params else []
+    if kind == 'fixed':
+        return lambda rng: values[0] if values else 0.0
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'exponential':
+        return lambda rng: rng.expovariate(1 / values[0])
+    if kind == 'lognormal':
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class MockServer:
+    """Threaded HTTP server answering `/v1/chat/completions`, with optional streaming and logprobs.
+
+    Prompt prefixes (all messages but the last) are remembered so repeated
+    prefixes are reported as `cached_tokens`, like a server with prefix caching.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: str = 'fixed:0', token_rate: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 503, retry_after: float = None,
+                 answers: list = None, seed: int = 0):
+        self.sample_latency = parse_latency(latency)
+        self.token_rate = token_rate
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.answers = (answers or []) + DEFAULT_ANSWERS
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._prefixes = set()
+        self._server = _Server((host, port), _Handler)
+        self._server.mock = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-server", daemon=True)
+        self._thread.start()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def answer(self, messages: list) -> str:
+        text = "\n".join(str(m.get("content", "")) for m in messages)
+        for needle, answer in self.answers:
+            if needle in text:
+                return answer
+        return "yes"
+
+    def plan(self, body: dict) -> dict:
+        """Decide the outcome of one request: an error status, or the answer, usage and delays."""
+        messages = body.get("messages", [])
+        prefix = hashlib.sha256(json.dumps(messages[:-1], sort_keys=True).encode()).hexdigest()
+        with self._lock:
+            self.requests += 1
+            fail = self._rng.random() < self.error_rate
+            latency = max(0.0, self.sample_latency(self._rng))
+            cached = prefix in self._prefixes
+            self._prefixes.add(prefix)
+            if fail:
+                self.errors += 1
+        if fail:
+            return {"status": self.error_status, "latency": latency}
+
+        answer = self.answer(messages)
+        prefix_tokens = sum(estimate_tokens(str(m.get("content", ""))) for m in messages[:-1])
+        prompt_tokens = prefix_tokens + (estimate_tokens(str(messages[-1].get("content", ""))) if messages else 0)
+        completion_tokens = estimate_tokens(answer)
+        return {
+            "status": 200,
+            "latency": latency,
+            "decode": completion_tokens / self.token_rate if self.token_rate > 0 else 0.0,
+            "answer": answer,
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": prefix_tokens if cached else 0},
+            },
+        }
+
+
+def _logprobs(answer: str, top: int) -> dict:
+    token = answer.split()[0] if answer.split() else answer
+    alternatives = [t for t in ALTERNATIVE_TOKENS if t != token][:max(top - 1, 0)]
+    top_logprobs = [{"token": token, "logprob": -0.05, "bytes": None}]
+    top_logprobs += [{"token": t, "logprob": -3.0 - i, "bytes": None} for i, t in enumerate(alternatives)]
+    return {"content": [{"token": token, "logprob": -0.05, "bytes": None, "top_logprobs": top_logprobs}]}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_event(self, payload):
+        data = f"data: {payload if isinstance(payload, str) else json.dumps(payload)}\n\n".encode()
+        self.wfile.write(b"%x\r\n" % len(data) + data + b"\r\n")
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/v1/models", "/health"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        mock = self.server.mock
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        plan = mock.plan(body)
+        time.sleep(plan["latency"])
+        if plan["status"] != 200:
+            headers = {"Retry-After": str(mock.retry_after)} if mock.retry_after is not None else None
+            self._send_json(plan["status"], {"error": {"message": "injected failure", "type": "mock_error"}}, headers)
+            return
+
+        answer = plan["answer"]
+        logprobs = _logprobs(answer, body.get("top_logprobs") or 1) if body.get("logprobs") else None
+        base = {"id": "mock", "created": int(time.time()), "model": body.get("model", "mock")}
+
+        if not body.get("stream"):
+            time.sleep(plan["decode"])
+            self._send_json(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "logprobs": logprobs, "finish_reason": "stop"}],
+                "usage": plan["usage"],
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        pieces = answer.split(" ")
+        for i, piece in enumerate(pieces):
+            time.sleep(plan["decode"] / len(pieces))
+            chunk = {"index": 0, "delta": {"content": piece if i == 0 else " " + piece}, "finish_reason": None}
+            if i == 0 and logprobs is not None:
+                chunk["logprobs"] = logprobs
+            self._send_event({**base, "object": "chat.completion.chunk", "choices": [chunk]})
+        self._send_event({**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self._send_event({**base, "object": "chat.completion.chunk", "choices": [], "usage": plan["usage"]})
+        self._send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock OpenAI-compatible chat completions server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help='Port to listen on (0 picks a free one)')
+    parser.add_argument('--latency', default='fixed:0', help='fixed:S, uniform:LO,HI, exponential:MEAN or lognormal:MEDIAN,SIGMA')
+    parser.add_argument('--token-rate', type=float, default=0.0, help='Completion tokens per second per request (0 = instant)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with --error-status')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--retry-after', type=float, default=None, help='Retry-After seconds sent with injected errors')
+    parser.add_argument('--answers', default=None, help='JSON file of [substring, answer] pairs tried before the defaults')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    answers = None
+    if args.answers:
+        with open(args.answers, 'r') as f:
+            answers = [tuple(pair) for pair in json.load(f)]
+
+    server = MockServer(args.host, args.port, latency=args.latency, token_rate=args.token_rate,
+                        error_rate=args.error_rate, error_status=args.error_status,
+                        retry_after=args.retry_after, answers=answers, seed=args.seed)
+    print(f"Listening on {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Two-stage pipeline that feeds target completions to a pool of judge workers."""
+
+import asyncio
+import logging
+
+from narrabench.batch import Deferred
+from narrabench.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+def judge_pipeline(engine: Engine, target_url: str, requests: list, judge_url: str, prepare, on_judgment,
+                   judge_workers: int = None, queue_size: int = None, log_every: int = 0, stop=None) -> dict:
+    """Send target `requests` and judge their answers while the target stage is still running.
+
+    `prepare(index, result)` runs as each target request finishes. It returns
+    None when no judge call is needed, or a `(key, judge_request)` pair. Answers
+    with the same key share one judge call. `on_judgment(index, judge_result)`
+    runs for every index once its key has been judged.
+
+    Target requests are limited by the target endpoint's budget. `judge_workers`
+    (default: the judge endpoint's capacity) drain a queue of at most
+    `queue_size` pending judge requests; a full queue holds back the target
+    stage. `stop` is passed on to `Engine.map` for the target stage. Judge
+    requests deferred to a batch file are dropped until their answers are
+    imported. Returns counts of judge calls sent and answers that shared one.
+    """
+    judge_workers = judge_workers or engine.capacity(judge_url)
+    queue_size = queue_size or 2 * judge_workers
+    return engine.run(_judge_pipeline(engine, target_url, requests, judge_url, prepare, on_judgment,
+                                      judge_workers, queue_size, log_every, stop))
+
+
+async def _judge_pipeline(engine, target_url, requests, judge_url, prepare, on_judgment, judge_workers, queue_size, log_every, stop):
+    queue = asyncio.Queue(maxsize=queue_size)
+    waiting = {}
+    verdicts = {}
+    stats = {'judged': 0, 'shared': 0}
+
+    def deliver(index, judge_result):
+        try:
+            on_judgment(index, judge_result)
+        except Exception:
+            logger.exception("    judgment callback failed")
+
+    async def produce(index, result):
+        item = prepare(index, result)
+        if item is None:
+            return
+        key, judge_request = item
+
+        if key in verdicts:
+            stats['shared'] += 1
+            deliver(index, verdicts[key])
+        elif key in waiting:
+            stats['shared'] += 1
+            waiting[key].append(index)
+        else:
+            waiting[key] = [index]
+            await queue.put((key, judge_request))
+
+    async def consume():
+        while True:
+            key, judge_request = await queue.get()
+            try:
+                judge_result = await engine.send(judge_url, judge_request)
+            except Deferred:
+                waiting.pop(key)
+                queue.task_done()
+                continue
+            except Exception as e:
+                judge_result = e
+            stats['judged'] += 1
+            verdicts[key] = judge_result
+            for index in waiting.pop(key):
+                deliver(index, judge_result)
+            queue.task_done()
+
+    workers = [asyncio.ensure_future(consume()) for _ in range(judge_workers)]
+    try:
+        await engine.map(target_url, requests, handle=produce, log_every=log_every, stop=stop)
+        await queue.join()
+    finally:
+        for worker in workers:
+            worker.cancel()
+    return stats
@@ -0,0 +1,173 @@
+"""Compiled prompt store: each benchmark's examples, built once and read back from a memory-mapped file.
+
+A store file holds a fixed header, a JSON index and a data section. Every
+example is a JSON record in the data section; strings of at least
+`INTERN_LENGTH` characters are kept once in the data section and referenced
+from the records, so a corpus repeated in every system prompt is stored and
+decoded once.
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import mmap
+import os
+import struct
+from pathlib import Path
+
+from narrabench.data import memoize
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MAGIC = b"NBPROMPT"
+HEADER = struct.Struct("<8sIQ")
+INTERN_LENGTH = 256
+
+store_dir = Path(".cache/narrabench/prompts")
+
+
+def fingerprint(path: Path) -> list:
+    """Identify a source file or directory by the names, sizes and modification times of its files."""
+    path = Path(path)
+    if path.is_file():
+        stat = path.stat()
+        return [str(path), stat.st_size, stat.st_mtime_ns]
+    if path.is_dir():
+        return [[str(p.relative_to(path)), p.stat().st_size, p.stat().st_mtime_ns] for p in sorted(path.rglob("*")) if p.is_file()]
+    return [str(path), None]
+
+
+def store_key(wrapper_path: Path, loader: str, args: tuple, sources: tuple) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{FORMAT_VERSION}\0{loader}\0{args!r}\0".encode())
+    digest.update(Path(wrapper_path).read_bytes())
+    digest.update(json.dumps([fingerprint(source) for source in sources]).encode())
+    return digest.hexdigest()
+
+
+def write_store(path: Path, key: str, examples: list):
+    """Write `examples` (JSON-serializable dicts with an 'id') to a store file at `path`, atomically."""
+    strings = {}
+    data = bytearray()
+
+    def intern(value):
+        if isinstance(value, str) and len(value) >= INTERN_LENGTH:
+            if value not in strings:
+                encoded = value.encode()
+                strings[value] = (len(strings), len(data), len(encoded))
+                data.extend(encoded)
+            return {"$ref": strings[value][0]}
+        if isinstance(value, dict):
+            return {k: intern(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [intern(v) for v in value]
+        return value
+
+    records = []
+    for example in examples:
+        encoded = json.dumps(intern(example), separators=(",", ":")).encode()
+        records.append([len(data), len(encoded)])
+        data.extend(encoded)
+
+    index = json.dumps({
+        "key": key,
+        "ids": [str(example["id"]) for example in examples],
+        "records": records,
+        "strings": [[offset, length] for _, offset, length in sorted(strings.values())],
+    }).encode()
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(f"{path.name}.{os.getpid()}.partial")
+    with open(partial, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(index)))
+        f.write(index)
+        f.write(data)
+    os.replace(partial, path)
+
+
+class PromptStore:
+    """Read-only sequence of the examples in a store file, decoded on access.
+
+    `ids` lists the example ids without decoding any example.
+    """
+
+    def __init__(self, path: Path, key: str = None):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, index_length = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{self.path} is not a version {FORMAT_VERSION} prompt store")
+        index = json.loads(self._map[HEADER.size:HEADER.size + index_length])
+        if key is not None and index["key"] != key:
+            raise ValueError(f"{self.path} was compiled from different sources")
+        self.key = index["key"]
+        self.ids = index["ids"]
+        self._records = index["records"]
+        self._string_spans = index["strings"]
+        self._strings = {}
+        self._base = HEADER.size + index_length
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, i: int) -> dict:
+        offset, length = self._records[i]
+        return json.loads(self._map[self._base + offset:self._base + offset + length], object_hook=self._resolve)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _resolve(self, value: dict):
+        if len(value) != 1 or "$ref" not in value:
+            return value
+        ref = value["$ref"]
+        if ref not in self._strings:
+            offset, length = self._string_spans[ref]
+            self._strings[ref] = self._map[self._base + offset:self._base + offset + length].decode()
+        return self._strings[ref]
+
+
+def precompiled(*sources: Path):
+    """Serve a wrapper's example loader from the prompt store, compiling it on first use.
+
+    The store file is keyed by the wrapper's source, the loader's arguments and
+    the sizes and modification times of `sources`, so editing the wrapper or
+    its data compiles a new one. With `store_dir` set to None the loader's list
+    is returned as is. Either way the result is memoized per process.
+    """
+
+    def decorate(loader):
+        wrapper_path = Path(inspect.getsourcefile(loader))
+        benchmark = wrapper_path.parent.name
+        signature = inspect.signature(loader)
+
+        @memoize
+        def load_bound(*args):
+            if store_dir is None:
+                return loader(*args)
+            key = store_key(wrapper_path, loader.__name__, args, sources)
+            path = Path(store_dir) / f"{benchmark}-{key[:16]}.prompts"
+            if path.exists():
+                try:
+                    return PromptStore(path, key)
+                except (ValueError, OSError, struct.error) as e:
+                    logger.warning(f"    {benchmark}: recompiling prompts ({e})")
+            examples = loader(*args)
+            write_store(path, key, examples)
+            logger.info(f"    {benchmark}: compiled {len(examples)} example(s) to {path}")
+            return PromptStore(path, key)
+
+        @functools.wraps(loader)
+        def load(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return load_bound(*bound.args)
+
+        return load
+
+    return decorate
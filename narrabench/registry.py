@@ -0,0 +1,43 @@
+"""Task registry: benchmark metadata read from each task's `task.toml`, without importing its wrapper."""
+
+import tomllib
+from pathlib import Path
+
+
+def discover_tasks(tasks_dir: Path) -> list:
+    """Return every task directory with a `wrapper.py`, in name order, with its `task.toml` metadata.
+
+    Each entry has `name`, `path`, `wrapper`, `feature` and `aspect` (the
+    NarraBench taxonomy, 'Unknown' when not declared) and `judge` (whether the
+    benchmark needs the judge model).
+    """
+    tasks = []
+    for task_path in sorted(Path(tasks_dir).iterdir()):
+        wrapper_path = task_path / "wrapper.py"
+        if not task_path.is_dir() or not wrapper_path.exists():
+            continue
+
+        metadata = {}
+        metadata_path = task_path / "task.toml"
+        if metadata_path.exists():
+            with open(metadata_path, 'rb') as f:
+                metadata = tomllib.load(f)
+
+        tasks.append({
+            'name': task_path.name,
+            'path': task_path,
+            'wrapper': wrapper_path,
+            'feature': metadata.get('feature', 'Unknown'),
+            'aspect': metadata.get('aspect', 'Unknown'),
+            'judge': bool(metadata.get('judge', False)),
+        })
+    return tasks
+
+
+def select_tasks(tasks: list, only: str) -> list:
+    """Keep the tasks named in the comma-separated `only`, raising ValueError for unknown names."""
+    names = [name.strip() for name in only.split(',') if name.strip()]
+    unknown = sorted(set(names) - {task['name'] for task in tasks})
+    if unknown:
+        raise ValueError(f"Unknown benchmark(s): {', '.join(unknown)}")
+    return [task for task in tasks if task['name'] in names]
@@ -0,0 +1,141 @@
+"""Append-only SQLite store of every run: its settings, per-benchmark results and per-example predictions."""
+
+import json
+import socket
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY, started REAL NOT NULL, finished REAL NOT NULL, host TEXT, command TEXT, settings TEXT
+);
+CREATE TABLE IF NOT EXISTS benchmarks (
+    run_id TEXT NOT NULL REFERENCES runs(id), benchmark TEXT NOT NULL, variant TEXT NOT NULL, model TEXT NOT NULL,
+    feature TEXT, aspect TEXT, accuracy REAL, ci_low REAL, ci_high REAL, examples INTEGER, failed INTEGER, telemetry TEXT
+);
+CREATE TABLE IF NOT EXISTS predictions (
+    run_id TEXT NOT NULL REFERENCES runs(id), benchmark TEXT NOT NULL, variant TEXT NOT NULL, model TEXT NOT NULL,
+    example_id TEXT NOT NULL, gold TEXT, response TEXT, verdict TEXT, score REAL
+);
+CREATE INDEX IF NOT EXISTS benchmarks_run ON benchmarks(run_id);
+CREATE INDEX IF NOT EXISTS benchmarks_model ON benchmarks(model, benchmark);
+CREATE INDEX IF NOT EXISTS benchmarks_benchmark ON benchmarks(benchmark, variant, model);
+CREATE INDEX IF NOT EXISTS predictions_run ON predictions(run_id, benchmark, variant, model);
+CREATE INDEX IF NOT EXISTS predictions_model ON predictions(model, benchmark);
+"""
+
+RESULT_FIELDS = ['benchmark', 'variant', 'model', 'feature', 'aspect', 'accuracy', 'ci_low', 'ci_high', 'examples', 'failed']
+
+
+def verdict_score(verdict):
+    """A journaled verdict as a score between 0 and 1: a bool or number as is, a dict of them as their mean."""
+    if isinstance(verdict, dict):
+        scores = [verdict_score(value) for value in verdict.values()]
+        scores = [score for score in scores if score is not None]
+        return sum(scores) / len(scores) if scores else None
+    if isinstance(verdict, (bool, int, float)):
+        return float(verdict)
+    return None
+
+
+def new_run_id() -> str:
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+class ResultsStore:
+    """Every run recorded so far, for leaderboards and per-label analysis without rerunning anything.
+
+    A run is only ever added, never updated: `record_run` writes its metadata,
+    one row per benchmark run (the same fields as `results.csv`, telemetry as
+    JSON) and every journaled example with its gold label, response, verdict
+    and score, all in one transaction, so an interrupted write leaves nothing
+    behind. `latest` and `breakdown` read the most recent result of each
+    benchmark, variant and model.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def record_run(self, started: float, command: str, settings: dict, rows: list, predictions: dict) -> str:
+        """Add a run and return its id.
+
+        `rows` are `results.csv` rows; `predictions` maps each row's
+        (benchmark, variant, model) to its journal records, with the example's
+        gold label under 'gold'.
+        """
+        run_id = new_run_id()
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute("INSERT INTO runs (id, started, finished, host, command, settings) VALUES (?, ?, ?, ?, ?, ?)",
+                               (run_id, started, time.time(), socket.gethostname(), command, json.dumps(settings, default=str)))
+            for row in rows:
+                telemetry = {k: v for k, v in row.items() if k not in RESULT_FIELDS}
+                self._conn.execute(
+                    f"INSERT INTO benchmarks (run_id, {', '.join(RESULT_FIELDS)}, telemetry) VALUES (?, {', '.join('?' * len(RESULT_FIELDS))}, ?)",
+                    (run_id, *(row[field] for field in RESULT_FIELDS), json.dumps(telemetry)))
+            for (benchmark, variant, model), records in predictions.items():
+                self._conn.executemany(
+                    "INSERT INTO predictions (run_id, benchmark, variant, model, example_id, gold, response, verdict, score) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(run_id, benchmark, variant, model, str(record['id']), json.dumps(record.get('gold')), json.dumps(record['response']),
+                      json.dumps(record['verdict']), verdict_score(record['verdict'])) for record in records])
+        return run_id
+
+    def runs(self, limit: int = 20) -> list:
+        """The most recent runs, newest first, with how many benchmark results and predictions each holds."""
+        return [dict(row) for row in self._conn.execute(
+            "SELECT r.id, r.started, r.finished, r.host, r.command,"
+            " (SELECT COUNT(*) FROM benchmarks b WHERE b.run_id = r.id) AS results,"
+            " (SELECT COUNT(*) FROM predictions p WHERE p.run_id = r.id) AS predictions"
+            " FROM runs r ORDER BY r.finished DESC LIMIT ?", (limit,))]
+
+    def latest(self, models: list = None, benchmarks: list = None, run_id: str = None) -> list:
+        """The most recent scored result of every benchmark, variant and model, or every result of `run_id`."""
+        where, params = self._filters(models, benchmarks)
+        if run_id is not None:
+            where.append("b.run_id = ?")
+            params.append(run_id)
+        else:
+            where.append("b.accuracy IS NOT NULL")
+        rows = self._conn.execute(
+            "SELECT * FROM (SELECT b.*, r.finished, ROW_NUMBER() OVER ("
+            "PARTITION BY b.benchmark, b.variant, b.model ORDER BY r.finished DESC) AS rank"
+            f" FROM benchmarks b JOIN runs r ON r.id = b.run_id WHERE {' AND '.join(where)})"
+            " WHERE rank = 1 ORDER BY benchmark, variant, model", params)
+        return [{**dict(row), 'telemetry': json.loads(row['telemetry'] or '{}')} for row in rows]
+
+    def breakdown(self, field: str, metric: str = None, models: list = None, benchmarks: list = None, run_id: str = None) -> list:
+        """Accuracy by the gold label's `field`, over the predictions of each result `latest` returns.
+
+        With a `metric`, the score is that field of each verdict (e.g. CuLEmo's
+        'emotion') instead of the whole verdict's score.
+        """
+        score = "json_extract(verdict, ?)" if metric else "score"
+        breakdown = []
+        for result in self.latest(models, benchmarks, run_id):
+            params = ([f"$.{metric}"] if metric else []) + [f"$.{field}", result['run_id'], result['benchmark'], result['variant'], result['model']]
+            rows = self._conn.execute(
+                f"SELECT label, COUNT(*) AS examples, AVG(value) AS accuracy FROM ("
+                f"SELECT {score} AS value, json_extract(gold, ?) AS label FROM predictions"
+                " WHERE run_id = ? AND benchmark = ? AND variant = ? AND model = ?)"
+                " GROUP BY label ORDER BY label", params)
+            breakdown.extend({'benchmark': result['benchmark'], 'variant': result['variant'], 'model': result['model'], **dict(row)} for row in rows)
+        return breakdown
+
+    @staticmethod
+    def _filters(models: list, benchmarks: list) -> tuple:
+        where, params = ["1 = 1"], []
+        for column, values in (('b.model', models), ('b.benchmark', benchmarks)):
+            if values:
+                where.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+        return where, params
+
+    def close(self):
+        self._conn.close()
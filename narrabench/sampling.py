@@ -0,0 +1,158 @@
+"""Sequential sampling: evaluate examples in a seeded random order and stop once accuracy is pinned down."""
+
+import hashlib
+import random
+from collections import defaultdict
+from statistics import NormalDist
+
+from narrabench.journal import Journal
+
+METHODS = ('wilson', 'bootstrap')
+
+
+def wilson_interval(mean: float, n: int, confidence: float = 0.95) -> tuple:
+    """Wilson score interval for a proportion `mean` observed over `n` examples."""
+    if n == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+    denominator = 1 + z * z / n
+    centre = (mean + z * z / (2 * n)) / denominator
+    margin = z * ((mean * (1 - mean) / n + z * z / (4 * n * n)) ** 0.5) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+def bootstrap_interval(values: list, confidence: float = 0.95, resamples: int = 1000, seed: int = 0) -> tuple:
+    """Percentile bootstrap interval for the mean of `values`."""
+    if not values:
+        return 0.0, 1.0
+    rng = random.Random(seed)
+    n = len(values)
+    means = sorted(sum(rng.choices(values, k=n)) / n for _ in range(resamples))
+    tail = (1 - confidence) / 2
+    return means[int(tail * (resamples - 1))], means[int((1 - tail) * (resamples - 1))]
+
+
+def shard_of(example_id: str, shards: int) -> int:
+    """The shard (0 to `shards` - 1) an example belongs to, from a hash of its id that is the same in every process."""
+    return int.from_bytes(hashlib.sha256(str(example_id).encode()).digest()[:8], 'big') % shards
+
+
+def parse_shard(value: str) -> tuple:
+    """Turn `I/N` into (I, N), checking that 0 <= I < N."""
+    index, sep, count = value.partition('/')
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise ValueError(f"Invalid shard {value!r}, expected I/N") from None
+    if not sep or count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {value!r}, expected I/N with 0 <= I < N")
+    return index, count
+
+
+class Sampler:
+    """Order and early-stopping rule for one benchmark run.
+
+    Without a `ci_width` examples keep the wrapper's order and every one is
+    evaluated; the interval is still reported. With one, `order` shuffles them
+    (by `seed`, so every model in a sweep sees the same sequence) and the
+    predicate from `stopper` turns true once at least `min_examples` are scored
+    and the `confidence` interval on accuracy is at most `ci_width` wide.
+
+    With a `shard` (I, N), `order` keeps only the examples whose id hashes to
+    shard I of N, so N processes each evaluate a disjoint part of the
+    benchmark; an early stop then applies to each shard on its own.
+    """
+
+    def __init__(self, ci_width: float = None, confidence: float = 0.95, method: str = 'wilson', seed: int = 0, min_examples: int = 30,
+                 shard: tuple = None):
+        if method not in METHODS:
+            raise ValueError(f"Unknown interval method: {method}. Use one of {', '.join(METHODS)}")
+        if not 0 < confidence < 1:
+            raise ValueError("confidence must be between 0 and 1")
+        self.ci_width = ci_width
+        self.confidence = confidence
+        self.method = method
+        self.seed = seed
+        self.min_examples = min_examples
+        self.shard = shard
+        self._journal = None
+        self._ids = []
+        self._value = float
+
+    @property
+    def sequential(self) -> bool:
+        return self.ci_width is not None
+
+    def order(self, examples, stratify=None) -> list:
+        """Return `examples` in evaluation order.
+
+        With `stratify(example)` giving each example's stratum, strata are
+        interleaved in proportion to their size, so every prefix of the order
+        is close to the full set's mix.
+        """
+        examples = list(examples)
+        if self.shard is not None:
+            index, count = self.shard
+            examples = [example for example in examples if shard_of(example['id'], count) == index]
+        if not self.sequential:
+            return examples
+        rng = random.Random(self.seed)
+        if stratify is None:
+            rng.shuffle(examples)
+            return examples
+
+        strata = defaultdict(list)
+        for example in examples:
+            strata[stratify(example)].append(example)
+        ranked = []
+        for members in strata.values():
+            rng.shuffle(members)
+            offset = rng.random()
+            ranked.extend(((i + offset) / len(members), rng.random(), example) for i, example in enumerate(members))
+        ranked.sort(key=lambda item: item[:2])
+        return [example for _, _, example in ranked]
+
+    def interval(self, values: list) -> tuple:
+        if self.method == 'bootstrap':
+            return bootstrap_interval(values, self.confidence, seed=self.seed)
+        return wilson_interval(sum(values) / len(values) if values else 0.0, len(values), self.confidence)
+
+    def stopper(self, journal: Journal, ids: list, value=float):
+        """Bind the run's journal and examples and return the `stop` predicate for `Engine.complete`.
+
+        `value(verdict)` turns a journaled verdict into a score between 0 and 1.
+        The interval is recomputed only after a twentieth more examples are
+        scored, which keeps bootstrap intervals cheap on long runs.
+        """
+        self._journal, self._ids, self._value = journal, list(ids), value
+        if not self.sequential:
+            return None
+        checked = 0
+        stopped = False
+
+        def stop() -> bool:
+            nonlocal checked, stopped
+            if stopped:
+                return True
+            values = self.values()
+            if len(values) < max(self.min_examples, 1) or len(values) < checked + max(1, checked // 20):
+                return False
+            checked = len(values)
+            low, high = self.interval(values)
+            stopped = high - low <= self.ci_width
+            return stopped
+
+        return stop
+
+    def values(self) -> list:
+        if self._journal is None:
+            return []
+        return [self._value(verdict) for verdict in self._journal.verdicts(self._ids)]
+
+    def summary(self) -> dict:
+        """The number of scored examples and the interval on their mean accuracy."""
+        values = self.values()
+        if not values:
+            return {'examples': 0, 'ci_low': None, 'ci_high': None}
+        low, high = self.interval(values)
+        return {'examples': len(values), 'ci_low': low, 'ci_high': high}
@@ -0,0 +1,133 @@
+"""Per-request timing and token accounting, summarized per benchmark."""
+
+import json
+import math
+from pathlib import Path
+
+SUMMARY_FIELDS = [
+    'requests', 'errors', 'retries', 'latency_p50', 'latency_p95', 'latency_p99', 'ttft_p50',
+    'requests_per_s', 'tokens_per_s', 'prompt_tokens', 'completion_tokens', 'completion_tokens_per_request', 'cached_ratio',
+    'connection_reuse', 'socket_wait_p95',
+]
+
+
+def percentile(values: list, q: float):
+    """Nearest-rank percentile of `values`, or None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class Telemetry:
+    """Records every model and judge call, optionally tracing each one to a JSONL file.
+
+    `latency` is the time a request spent at the server, `queued` the time it
+    waited for a slot in its endpoint's budget, and `ttft` the time to the first
+    streamed token. `reused` tells whether the request went out on a pooled
+    connection and `socket_wait` how long it waited for one (see
+    `narrabench.transport`). Requests answered from the response cache are
+    counted but kept out of the latency percentiles. A request sent more than
+    once has one record per attempt; all but the last are marked not `final`
+    and counted as retries.
+    """
+
+    def __init__(self, trace_path: Path = None):
+        self.records = {}
+        self._trace = None
+        if trace_path is not None:
+            Path(trace_path).parent.mkdir(parents=True, exist_ok=True)
+            self._trace = open(trace_path, 'w')
+
+    def record(self, benchmark: str, endpoint: str, start: float, queued: float = 0.0, latency: float = 0.0,
+               ttft: float = None, usage=None, cache_hit: bool = False, attempt: int = 0, error: str = None, replica: str = None, final: bool = True,
+               reused: bool = None, socket_wait: float = None):
+        details = getattr(usage, 'prompt_tokens_details', None) if usage is not None else None
+        record = {
+            'benchmark': benchmark,
+            'endpoint': endpoint,
+            'replica': replica or endpoint,
+            'start': start,
+            'queued': queued,
+            'latency': latency,
+            'ttft': ttft,
+            'prompt_tokens': (usage.prompt_tokens or 0) if usage is not None else 0,
+            'completion_tokens': (usage.completion_tokens or 0) if usage is not None else 0,
+            'cached_tokens': (details.cached_tokens or 0) if details is not None else 0,
+            'cache_hit': cache_hit,
+            'attempt': attempt,
+            'final': final,
+            'error': error,
+            'reused': reused,
+            'socket_wait': socket_wait,
+        }
+        self.records.setdefault(benchmark, []).append(record)
+        if self._trace is not None:
+            self._trace.write(json.dumps(record) + "\n")
+
+    def load(self, trace_path: Path):
+        """Add the records of a trace written by another run, e.g. one shard of a sharded run, tracing them again."""
+        with open(trace_path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.records.setdefault(record['benchmark'], []).append(record)
+                if self._trace is not None:
+                    self._trace.write(json.dumps(record) + "\n")
+
+    def summary(self, benchmark: str) -> dict:
+        attempts = self.records.get(benchmark, [])
+        records = [r for r in attempts if r['final']]
+        served = [r for r in records if not r['cache_hit'] and r['error'] is None]
+        latencies = [r['latency'] for r in served]
+        ttfts = [r['ttft'] for r in served if r['ttft'] is not None]
+        prompt_tokens = sum(r['prompt_tokens'] for r in served)
+        completion_tokens = sum(r['completion_tokens'] for r in served)
+        cached_tokens = sum(r['cached_tokens'] for r in served)
+        wired = [r for r in attempts if r.get('socket_wait') is not None]
+
+        wall = 0.0
+        if attempts:
+            wall = max(r['start'] + r['queued'] + r['latency'] for r in attempts) - min(r['start'] for r in attempts)
+
+        return {
+            'requests': len(records),
+            'errors': sum(r['error'] is not None for r in records),
+            'retries': len(attempts) - len(records),
+            'latency_p50': percentile(latencies, 50),
+            'latency_p95': percentile(latencies, 95),
+            'latency_p99': percentile(latencies, 99),
+            'ttft_p50': percentile(ttfts, 50),
+            'requests_per_s': len(records) / wall if wall > 0 else None,
+            'tokens_per_s': completion_tokens / wall if wall > 0 else None,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'completion_tokens_per_request': completion_tokens / len(served) if served else None,
+            'cached_ratio': cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+            'connection_reuse': sum(r['reused'] for r in wired) / len(wired) if wired else None,
+            'socket_wait_p95': percentile([r['socket_wait'] for r in wired], 95),
+        }
+
+    def replicas(self) -> dict:
+        """Request, error and latency counts per replica, across benchmarks, for requests that reached a server."""
+        by_replica = {}
+        for records in self.records.values():
+            for r in records:
+                if not r['cache_hit']:
+                    by_replica.setdefault(r['replica'], []).append(r)
+        return {
+            replica: {
+                'requests': len(records),
+                'errors': sum(r['error'] is not None for r in records),
+                'latency_p50': percentile([r['latency'] for r in records if r['error'] is None], 50),
+                'latency_p95': percentile([r['latency'] for r in records if r['error'] is None], 95),
+            }
+            for replica, records in sorted(by_replica.items())
+        }
+
+    def close(self):
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
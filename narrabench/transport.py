@@ -0,0 +1,111 @@
+"""One pooled HTTP client shared by every endpoint, with connection reuse and socket-wait accounting."""
+
+import contextlib
+import contextvars
+import time
+from collections import Counter
+
+import httpx
+
+from narrabench.telemetry import percentile
+
+_wire = contextvars.ContextVar("narrabench_wire", default=None)
+
+
+class Wire:
+    """How one request got onto a connection: whether it `reused` a pooled one and how long it waited for it.
+
+    `wait` is the time from handing the request to the pool to writing its
+    first byte: waiting for a free connection, plus opening one (TCP and TLS)
+    when none could be reused.
+    """
+
+    __slots__ = ('queued', 'wait', 'reused', 'protocol')
+
+    def __init__(self):
+        self.queued = None
+        self.wait = None
+        self.reused = None
+        self.protocol = None
+
+
+class Transport:
+    """The HTTP connection pool behind every OpenAI client of an `Engine`.
+
+    At most `pool_size` connections are open at once, across all endpoints,
+    and as many are kept alive between requests for `keepalive` seconds; size
+    it to the total concurrency so no request waits for a socket. `http2`
+    offers HTTP/2 through ALPN (needs the `h2` package); servers that only
+    speak HTTP/1.1 over plain HTTP keep using it. `connect_timeout` bounds
+    opening a connection and `read_timeout` waiting for the server, which for
+    a long generation can be minutes.
+
+    Every request sent inside `track` is traced through httpcore, so the
+    engine can record whether it reused a connection and how long it waited
+    for one; `summary` totals them over the whole run.
+    """
+
+    def __init__(self, pool_size: int = 100, keepalive: float = 15.0, http2: bool = False,
+                 connect_timeout: float = 5.0, read_timeout: float = 600.0):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        self.pool_size = pool_size
+        self.http2 = http2
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size, keepalive_expiry=keepalive),
+            event_hooks={"request": [self._attach]},
+        )
+        self.opened = 0
+        self.reused = 0
+        self.waits = []
+        self.protocols = Counter()
+
+    @contextlib.contextmanager
+    def track(self):
+        """Trace the requests sent in this block (on the current task) and yield their `Wire`."""
+        wire = Wire()
+        token = _wire.set(wire)
+        try:
+            yield wire
+        finally:
+            _wire.reset(token)
+
+    async def _attach(self, request: httpx.Request):
+        wire = _wire.get()
+        if wire is None:
+            return
+        wire.queued = time.perf_counter()
+        wire.reused = True
+        request.extensions = {**request.extensions, "trace": self._trace}
+
+    async def _trace(self, event: str, info: dict):
+        wire = _wire.get()
+        if wire is None:
+            return
+        if event == "connection.connect_tcp.started":
+            wire.reused = False
+            self.opened += 1
+        elif event.endswith(".send_request_headers.started") and wire.wait is None:
+            wire.wait = time.perf_counter() - wire.queued
+            wire.protocol = "HTTP/2" if event.startswith("http2.") else "HTTP/1.1"
+            self.waits.append(wire.wait)
+            self.reused += wire.reused
+            self.protocols[wire.protocol] += 1
+
+    def summary(self) -> dict:
+        """Requests written, connections opened, and the share of requests that reused one, with socket wait percentiles."""
+        sent = len(self.waits)
+        return {
+            'requests': sent,
+            'connections': self.opened,
+            'reuse': self.reused / sent if sent else None,
+            'socket_wait_p50': percentile(self.waits, 50),
+            'socket_wait_p95': percentile(self.waits, 95),
+            'protocols': dict(self.protocols),
+        }
+
+    async def aclose(self):
+        await self.client.aclose()
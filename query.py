@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Query the results store that run.py appends to (see narrabench/results.py).
+
+Without options, prints the latest accuracy of every benchmark, one column per
+model. `--by FIELD` breaks accuracy down by a field of the gold label, e.g.
+`--only culemo --by emotion_eng --metric emotion`. `--runs` lists the runs
+recorded so far and `--run ID` restricts any table to one of them. `--csv`
+writes the table to a file as well.
+"""
+
+import argparse
+import csv
+import logging
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from narrabench.results import ResultsStore
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger(__name__)
+
+
+def format_value(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.4f}"
+    return str(value)
+
+
+def comparison(results: list, value: str) -> tuple:
+    """One row per benchmark and variant, one column per model, holding each result's `value`."""
+    models = sorted({r['model'] for r in results})
+    rows = {}
+    for r in results:
+        name = f"{r['benchmark']}[{r['variant']}]" if r['variant'] else r['benchmark']
+        rows.setdefault(name, {'benchmark': name})[r['model']] = r[value] if value in r else r['telemetry'].get(value)
+    return ['benchmark'] + models, list(rows.values())
+
+
+def print_table(header: list, rows: list):
+    widths = [max([len(column)] + [len(format_value(row.get(column))) for row in rows]) for column in header]
+    logger.info("  ".join(f"{column:<{width}}" for column, width in zip(header, widths)))
+    logger.info("-" * (sum(widths) + 2 * (len(widths) - 1)))
+    for row in rows:
+        logger.info("  ".join(f"{format_value(row.get(column)):<{width}}" for column, width in zip(header, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare NarraBench runs recorded in the results store')
+    parser.add_argument('--db', default='results.sqlite', help='Results store written by run.py --results-db')
+    parser.add_argument('--model', nargs='+', default=None, help='Only these models')
+    parser.add_argument('--only', default=None, metavar='NAMES', help='Comma-separated benchmarks to show (default: all)')
+    parser.add_argument('--run', default=None, metavar='ID', help='Show the results of this run instead of the latest of each benchmark and model')
+    parser.add_argument('--runs', action='store_true', help='List the most recent runs and exit')
+    parser.add_argument('--limit', type=int, default=20, help='Runs listed by --runs')
+    parser.add_argument('--value', default='accuracy', help='Column compared across models: accuracy, or any other results.csv column such as latency_p50')
+    parser.add_argument('--by', default=None, metavar='FIELD', help='Break accuracy down by this field of the gold label, e.g. emotion_eng for CuLEmo')
+    parser.add_argument('--metric', default=None, metavar='NAME', help='With --by, score this field of each verdict (e.g. emotion) instead of the whole verdict')
+    parser.add_argument('--csv', default=None, metavar='PATH', help='Also write the table to this CSV file')
+    args = parser.parse_args()
+
+    if not Path(args.db).exists():
+        parser.error(f"No results store at {args.db}; run.py creates it")
+    if args.metric and not args.by:
+        parser.error("--metric needs --by")
+
+    store = ResultsStore(Path(args.db))
+    benchmarks = [name.strip() for name in args.only.split(',')] if args.only else None
+    clock = time.perf_counter()
+
+    if args.runs:
+        runs = store.runs(args.limit)
+        header = ['id', 'finished', 'host', 'results', 'predictions', 'command']
+        rows = [{**run, 'finished': datetime.fromtimestamp(run['finished']).strftime('%Y-%m-%d %H:%M')} for run in runs]
+    elif args.by:
+        rows = store.breakdown(args.by, args.metric, args.model, benchmarks, args.run)
+        header = ['benchmark', 'variant', 'model', 'label', 'examples', 'accuracy']
+    else:
+        header, rows = comparison(store.latest(args.model, benchmarks, args.run), args.value)
+    elapsed = time.perf_counter() - clock
+    store.close()
+
+    if not rows:
+        logger.info("No matching results")
+        sys.exit(1)
+    print_table(header, rows)
+    logger.info(f"\n{len(rows)} row(s) in {elapsed * 1000:.1f} ms")
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=header, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+        logger.info(f"Written to {args.csv}")
+
+
+if __name__ == '__main__':
+    main()
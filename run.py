@@ -3,10 +3,31 @@
 import argparse
 import csv
 import importlib.util
+import inspect
+import json
+import os
+import subprocess
 import sys
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from tqdm import tqdm
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+from narrabench.data import memoize
+from narrabench.journal import Journal
+from narrabench import prompts
+from narrabench.registry import discover_tasks, select_tasks
+from narrabench.sampling import METHODS, Sampler, parse_shard
+from narrabench.telemetry import SUMMARY_FIELDS, Telemetry
+
+if TYPE_CHECKING:
+    from narrabench.engine import Engine
+
+# Heavy modules (openai, datasets, tqdm) are imported only once a run starts, so
+# --help and --list stay fast; datasets reads this when a wrapper first imports it.
+os.environ.setdefault("HF_DATASETS_DISABLE_PROGRESS_BARS", "1")
 
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 logger = logging.getLogger(__name__)
@@ -15,34 +36,11 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("openai").setLevel(logging.WARNING)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
 
-from datasets.utils.logging import disable_progress_bar
-disable_progress_bar()
-
-BENCHMARK_TAXONOMY = {
-    'austenalike': {'feature': 'Story', 'aspect': 'Agent/Attributes'},
-    'culemo': {'feature': 'Story', 'aspect': 'Agent/Emotional State'},
-    'phantomwiki': {'feature': 'Story', 'aspect': 'Social Networks/Connections'},
-    'storysumm': {'feature': 'Story', 'aspect': 'Plot/Plotline'},
-    'tot': {'feature': 'Discourse', 'aspect': 'Time/Order'},
-    'tram': {'feature': 'Discourse', 'aspect': 'Time/Order'},
-    'traveler': {'feature': 'Discourse', 'aspect': 'Time/Order'},
-}
-
-
-def discover_benchmarks(tasks_dir: Path):
-    benchmarks = []
-    for task_path in sorted(tasks_dir.iterdir()):
-        if task_path.is_dir():
-            wrapper_path = task_path / "wrapper.py"
-            if wrapper_path.exists():
-                benchmarks.append({
-                    'name': task_path.name,
-                    'path': task_path,
-                    'wrapper': wrapper_path
-                })
-    return benchmarks
+# Written to a shard's --journal-dir once the shard has finished, for --merge.
+SHARD_MARKER = "shard.json"
 
 
+@memoize
 def load_wrapper(wrapper_path: Path):
     spec = importlib.util.spec_from_file_location("wrapper", wrapper_path)
     module = importlib.util.module_from_spec(spec)
@@ -50,68 +48,547 @@ def load_wrapper(wrapper_path: Path):
     return module
 
 
+def journal_path(journal_dir: str, model: str, name: str) -> Path:
+    return Path(journal_dir) / model.replace('/', '__') / f"{name.replace('/', '__')}.jsonl"
+
+
+def variant_tag(variant: dict) -> str:
+    """`key=value,...` naming one variant of a benchmark's options, or '' for its defaults."""
+    return ",".join(f"{key}={value}" for key, value in variant.items())
+
+
+def benchmark_variants(benchmark: dict) -> list:
+    """The option sets the benchmark's wrapper declares in `variants()`, for --sweep."""
+    wrapper = load_wrapper(benchmark['wrapper'])
+    if not hasattr(wrapper, 'variants'):
+        raise ValueError(f"{benchmark['name']} declares no variants to sweep")
+    variants = wrapper.variants()
+    if not variants:
+        raise ValueError(f"{benchmark['name']} has no variants on disk; run setup.py first")
+    return variants
+
+
+def endpoint_url(value: str) -> str:
+    """Turn `host:port` or a full URL into an OpenAI-compatible base URL."""
+    if '://' not in value:
+        value = f"http://{value}/v1"
+    return value.rstrip('/')
+
+
+def load_models(path: str) -> dict:
+    """Read a JSON file mapping each model name to its endpoint, or a list of replica endpoints."""
+    with open(path, 'r') as f:
+        models = json.load(f)
+    if not isinstance(models, dict) or not models:
+        raise ValueError(f"{path} must map model names to endpoints")
+    return {model: [endpoint_url(e) for e in (endpoints if isinstance(endpoints, list) else [endpoints])]
+            for model, endpoints in models.items()}
+
+
+def parse_task_options(values: list) -> dict:
+    """Turn `NAME.KEY=VALUE` strings into {name: {key: value}} keyword arguments for wrappers."""
+    options = {}
+    for value in values:
+        target, sep, setting = value.partition('=')
+        name, dot, key = target.partition('.')
+        if not sep or not dot or not name or not key:
+            raise ValueError(f"Invalid task option {value!r}, expected NAME.KEY=VALUE")
+        options.setdefault(name, {})[key.replace('-', '_')] = setting
+    return options
+
+
+def compile_prompts(benchmarks: list, task_options: dict):
+    """Build the prompt store of every benchmark, with the loader options given as task options."""
+    failed = 0
+    for benchmark in benchmarks:
+        try:
+            wrapper = load_wrapper(benchmark['wrapper'])
+            parameters = inspect.signature(wrapper.load_examples).parameters
+            options = {k: v for k, v in task_options.get(benchmark['name'], {}).items() if k in parameters}
+            examples = wrapper.load_examples(**options)
+            logger.info(f"  ✓ {benchmark['name']}: {len(examples)} example(s)")
+        except Exception as e:
+            failed += 1
+            logger.info(f"  ✗ {benchmark['name']}: Error: {e}")
+    if failed:
+        sys.exit(1)
+
+
+def run_one(run: dict, args, engine: "Engine", options: dict, resume: bool) -> dict:
+    """Run one benchmark on one model and return its accuracy with the examples scored and their interval."""
+    wrapper = load_wrapper(run['benchmark']['wrapper'])
+    if args.scoring and 'scoring' in inspect.signature(wrapper.run_benchmark).parameters:
+        options = {'scoring': args.scoring, **options}
+    options = {**options, **run['variant']}
+    journal = Journal(journal_path(args.journal_dir, run['model'], run['name']), resume=resume)
+    sampler = Sampler(ci_width=args.ci_width, confidence=args.confidence, method=args.ci_method, seed=args.seed, min_examples=args.min_examples,
+                      shard=args.shard)
+    try:
+        accuracy = wrapper.run_benchmark(run['model'], run['host'], run['port'], args.judge_host, args.judge_port,
+                                         engine=engine.bind(run['label']), journal=journal, sampler=sampler, **options)
+        return {'accuracy': accuracy, **sampler.summary()}
+    finally:
+        journal.close()
+
+
+def run_pass(pool: ThreadPoolExecutor, runs: list, args, engine: "Engine", task_options: dict, resume: bool, desc: str) -> dict:
+    """Run every (benchmark, model) pair in `runs` on the pool and return their outcomes (see `run_one`) by label."""
+    from tqdm import tqdm
+
+    outcomes = {}
+    with tqdm(total=len(runs), desc=desc, unit="benchmark") as progress:
+        futures = {pool.submit(run_one, run, args, engine, task_options.get(run['benchmark']['name'], {}), resume): run['label'] for run in runs}
+        for future in as_completed(futures):
+            label = futures[future]
+            try:
+                outcomes[label] = future.result()
+                tqdm.write(f"  ✓ {label}: {outcomes[label]['accuracy']:.4f}")
+            except Exception as e:
+                outcomes[label] = {'accuracy': None, 'examples': None, 'ci_low': None, 'ci_high': None}
+                tqdm.write(f"  ✗ {label}: Error: {e}")
+            progress.update()
+    return outcomes
+
+
+def write_dead_letters(path: Path, dead_letters: list):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        for letter in dead_letters:
+            f.write(json.dumps(letter) + "\n")
+
+
+def read_jsonl(path: Path) -> list:
+    """The records of a JSONL file, skipping a torn last line; none if the file does not exist."""
+    if not path.exists():
+        return []
+    records = []
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def without_option(argv: list, option: str, optional: bool = False) -> list:
+    """`argv` without `option` and its value, in either `--option VALUE` or `--option=VALUE` form.
+
+    With `optional`, the option may have no value, as `--profile` may; run.py
+    takes no positional arguments, so a following argument that is not an
+    option is its value.
+    """
+    kept = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+            if not (optional and arg.startswith('-')):
+                continue
+        if arg == option:
+            skip = True
+        elif not arg.startswith(f"{option}="):
+            kept.append(arg)
+    return kept
+
+
+def launch_shards(argv: list, count: int, root: Path) -> list:
+    """Run this script once per shard, `count` processes at once, and return the shard directories.
+
+    Each shard gets the same arguments plus `--shard I/N` and its own journal
+    directory and results file under `root`, and logs to `run.log` there.
+    Rerunning with --resume resumes every shard.
+    """
+    # Every shard traces to its own directory instead of a shared --profile; the merge writes that one.
+    argv = without_option(without_option(argv, '--shards'), '--profile', optional=True)
+    shard_dirs = [root / f"{index}-of-{count}" for index in range(count)]
+    processes = []
+    for index, shard_dir in enumerate(shard_dirs):
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        (shard_dir / SHARD_MARKER).unlink(missing_ok=True)
+        log = open(shard_dir / "run.log", 'w')
+        command = [sys.executable, str(Path(__file__).resolve()), *argv, '--shard', f"{index}/{count}",
+                   '--journal-dir', str(shard_dir), '--output', str(shard_dir / "results.csv")]
+        processes.append((subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT), log))
+    logger.info(f"Launched {count} shard(s), logging to {root}/*/run.log")
+
+    failed = []
+    for shard_dir, (process, log) in zip(shard_dirs, processes):
+        process.wait()
+        log.close()
+        if process.returncode != 0:
+            failed.append(f"{shard_dir} (exit {process.returncode})")
+    if failed:
+        raise RuntimeError(f"Shard(s) failed, see their run.log: {', '.join(failed)}")
+    return shard_dirs
+
+
+def journal_predictions(run: dict, journal_dir: str, options: dict) -> list:
+    """The run's journaled examples, latest record per id, each with its gold label from the wrapper's examples."""
+    records = {record['id']: record for record in read_jsonl(journal_path(journal_dir, run['model'], run['name']))}
+    if not records:
+        return []
+    try:
+        wrapper = load_wrapper(run['benchmark']['wrapper'])
+        parameters = inspect.signature(wrapper.load_examples).parameters
+        golds = {example['id']: example.get('gold') for example in
+                 wrapper.load_examples(**{k: v for k, v in {**options, **run['variant']}.items() if k in parameters})}
+    except Exception as e:
+        logger.warning(f"  {run['label']}: predictions recorded without gold labels ({e})")
+        golds = {}
+    return [{**record, 'gold': golds.get(record['id'])} for record in records.values()]
+
+
+def merge_shards(shard_dirs: list, runs: list, journal_dir: str) -> dict:
+    """Combine the journals of finished shards into `journal_dir` and return their failed requests by run label.
+
+    The shards must be exactly the N shards of one I/N split. Journals are
+    written in shard order, so merging the same shards twice gives the same
+    files.
+    """
+    markers = {}
+    for shard_dir in shard_dirs:
+        marker = Path(shard_dir) / SHARD_MARKER
+        if not marker.exists():
+            raise ValueError(f"{shard_dir} is not a finished shard (no {SHARD_MARKER})")
+        with open(marker, 'r') as f:
+            shard = json.load(f)
+        if shard['index'] in markers:
+            raise ValueError(f"Shard {shard['index']}/{shard['count']} given twice")
+        markers[shard['index']] = (shard['count'], Path(shard_dir))
+    counts = {count for count, _ in markers.values()}
+    if len(counts) != 1 or set(markers) != set(range(counts.pop())):
+        raise ValueError(f"Shards {', '.join(f'{i}/{c}' for i, (c, _) in sorted(markers.items()))} are not one complete split")
+    ordered = [shard_dir for _, (_, shard_dir) in sorted(markers.items())]
+
+    dead_letters = {}
+    for run in runs:
+        merged = journal_path(journal_dir, run['model'], run['name'])
+        merged.parent.mkdir(parents=True, exist_ok=True)
+        with open(merged, 'w') as f:
+            for shard_dir in ordered:
+                for record in read_jsonl(journal_path(shard_dir, run['model'], run['name'])):
+                    f.write(json.dumps(record) + "\n")
+        dead_letters[run['label']] = [letter for shard_dir in ordered
+                                      for letter in read_jsonl(journal_path(shard_dir, run['model'], run['name']).with_suffix('.failed.jsonl'))]
+    return dead_letters
+
+
+def result_row(benchmark: dict, variant: dict, model: str, outcome: dict, failed: int, telemetry: dict) -> dict:
+    row = {
+        'benchmark': benchmark['name'],
+        'variant': variant_tag(variant),
+        'model': model,
+        'feature': benchmark['feature'],
+        'aspect': benchmark['aspect'],
+        'accuracy': outcome['accuracy'],
+        'ci_low': round(outcome['ci_low'], 4) if outcome['ci_low'] is not None else None,
+        'ci_high': round(outcome['ci_high'], 4) if outcome['ci_high'] is not None else None,
+        'examples': outcome['examples'],
+        'failed': failed,
+    }
+    row.update({k: round(v, 4) if isinstance(v, float) else v for k, v in telemetry.items()})
+    return row
+
+
 def main():
     parser = argparse.ArgumentParser(description='Run NarraBench benchmarks')
-    parser.add_argument('--model', required=True)
+    parser.add_argument('--model', nargs='+', default=[], help='Model(s) to evaluate; several models are run side by side against --host/--port')
+    parser.add_argument('--models-file', default=None, help='JSON file mapping each model to its endpoint (host:port or base URL) or list of replica endpoints')
     parser.add_argument('--port', type=int, default=11434)
     parser.add_argument('--host', default='localhost')
     parser.add_argument('--judge-port', type=int, default=11435)
     parser.add_argument('--judge-host', default='localhost')
-    parser.add_argument('--output', default='results.csv')
+    parser.add_argument('--output', default='results.csv', help='CSV of this run\'s results, one row per benchmark and model (overwritten)')
+    parser.add_argument('--results-db', default='results.sqlite', help='SQLite store every run is appended to, with per-example predictions; query it with query.py')
+    parser.add_argument('--no-results-db', action='store_true', help='Do not record the run in --results-db')
+    parser.add_argument('--endpoint', action='append', default=[], metavar='URL', help='Replica of the target model as host:port or base URL, load-balanced with the others (repeatable; default: --host/--port)')
+    parser.add_argument('--judge-endpoint', action='append', default=[], metavar='URL', help='Replica of the judge model, as for --endpoint (repeatable; default: --judge-host/--judge-port)')
+    parser.add_argument('--concurrency', type=int, default=64, help='Maximum in-flight requests per target replica')
+    parser.add_argument('--judge-concurrency', type=int, default=16, help='Maximum in-flight requests per judge replica')
+    parser.add_argument('--fixed-concurrency', action='store_true', help='Keep concurrency at its maximum instead of backing off when a server is overloaded')
+    parser.add_argument('--pool-size', type=int, default=None, help='HTTP connections kept open across all endpoints (default: the total target and judge concurrency)')
+    parser.add_argument('--keepalive', type=float, default=15.0, help='Seconds an idle HTTP connection is kept for reuse')
+    parser.add_argument('--http2', action='store_true', help='Offer HTTP/2 to the servers (needs the h2 package)')
+    parser.add_argument('--connect-timeout', type=float, default=5.0, help='Seconds allowed to open a connection')
+    parser.add_argument('--read-timeout', type=float, default=600.0, help='Seconds allowed between bytes of a response')
+    parser.add_argument('--max-retries', type=int, default=4, help='Times a request is retried after a connection error, timeout, 408/409/429 or 5xx')
+    parser.add_argument('--retry-failed', type=int, default=1, help='Passes over examples whose requests still failed, at the end of the run')
+    parser.add_argument('--parallel', type=int, default=4, help='Number of benchmark runs (one per benchmark and model) at the same time')
+    parser.add_argument('--cache-dir', default='.cache/narrabench', help='Directory of the persistent response cache')
+    parser.add_argument('--cache-size', type=int, default=1024, help='Response cache size limit in MB')
+    parser.add_argument('--no-cache', action='store_true', help='Send every request without reading or writing the cache')
+    parser.add_argument('--prefix-threshold', type=int, default=1024, help='Group and prime requests sharing a prompt prefix of at least this many characters (0 disables)')
+    parser.add_argument('--prompt-dir', default='.cache/narrabench/prompts', help='Directory of compiled prompt stores, one file per benchmark and version of its wrapper and data')
+    parser.add_argument('--no-prompt-store', action='store_true', help='Build prompts in memory instead of reading compiled prompt stores')
+    parser.add_argument('--list', action='store_true', help='List the benchmarks with their taxonomy and exit')
+    parser.add_argument('--only', default=None, metavar='NAMES', help='Comma-separated benchmarks to run (default: all)')
+    parser.add_argument('--sweep', default=None, metavar='NAMES',
+                        help='Comma-separated benchmarks to run once per variant their wrapper declares, e.g. every TRaVelER event-log size and question set')
+    parser.add_argument('--compile', action='store_true', help='Compile the prompt store of every benchmark and exit')
+    parser.add_argument('--journal-dir', default='journal', help='Directory of per-example journals, one file per model and benchmark')
+    parser.add_argument('--resume', action='store_true', help='Skip examples already in the journal and rebuild accuracy from it')
+    parser.add_argument('--stream', action='store_true', help='Stream responses to measure time to first token')
+    parser.add_argument('--profile', nargs='?', const='trace.jsonl', metavar='PATH', help='Write a per-request JSONL trace (default path: trace.jsonl)')
+    parser.add_argument('--ci-width', type=float, default=None, metavar='WIDTH',
+                        help='Stop each benchmark once the confidence interval on its accuracy is at most this wide, drawing examples in a seeded random order')
+    parser.add_argument('--confidence', type=float, default=0.95, help='Confidence level of the reported interval')
+    parser.add_argument('--ci-method', choices=METHODS, default='wilson', help='Interval on accuracy: Wilson score or percentile bootstrap')
+    parser.add_argument('--min-examples', type=int, default=30, help='Examples scored before --ci-width can stop a benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the example order used with --ci-width')
+    parser.add_argument('--scoring', choices=['generate', 'logprobs'], default=None,
+                        help='How benchmarks with a closed set of answers score them: parse generated text, or take the most probable option from one token\'s logprobs (default: each benchmark\'s own)')
+    parser.add_argument('--export-batch', default=None, metavar='DIR',
+                        help='Send nothing: write the requests not answered by --import-batch to DIR/<model>.jsonl in OpenAI batch format')
+    parser.add_argument('--import-batch', action='append', default=[], metavar='PATH',
+                        help='Score the answers in a batch output JSONL file, or every file in a directory, instead of sending requests (repeatable)')
+    parser.add_argument('--shard', default=None, metavar='I/N',
+                        help='Evaluate only the examples whose id hashes to shard I of N (0-based), e.g. on one of N client machines; combine the shards with --merge')
+    parser.add_argument('--shards', type=int, default=None, metavar='N',
+                        help='Run N shards as local processes, each with its own journal under --journal-dir/shards, then merge them')
+    parser.add_argument('--merge', nargs='+', default=None, metavar='DIR',
+                        help='Send nothing: combine the --journal-dir of every shard of a split into --journal-dir and write the results a single run would')
+    parser.add_argument('--task-option', action='append', default=[], metavar='NAME.KEY=VALUE', help='Pass a keyword option to one benchmark, e.g. culemo.mode=fused (repeatable)')
     args = parser.parse_args()
+    started = time.time()
+
+    try:
+        task_options = parse_task_options(args.task_option)
+        models = load_models(args.models_file) if args.models_file else {}
+    except (ValueError, OSError) as e:
+        parser.error(str(e))
+    if not args.model and not models and not args.compile and not args.list:
+        parser.error("Provide --model or --models-file")
+    if args.ci_width is not None and not 0 < args.ci_width < 1:
+        parser.error("--ci-width must be between 0 and 1")
+    if not 0 < args.confidence < 1:
+        parser.error("--confidence must be between 0 and 1")
+    if sum(option is not None for option in (args.shard, args.shards, args.merge)) > 1:
+        parser.error("--shard, --shards and --merge cannot be combined")
+    if (args.shards or args.merge) and (args.export_batch or args.import_batch):
+        parser.error("--shards and --merge cannot be combined with batch mode")
+    if args.shards is not None and args.shards < 1:
+        parser.error("--shards must be at least 1")
+    if args.shard is not None:
+        try:
+            args.shard = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+    prompts.store_dir = None if args.no_prompt_store else Path(args.prompt_dir)
 
     tasks_dir = Path(__file__).parent / "tasks"
-    benchmarks = discover_benchmarks(tasks_dir)
+    benchmarks = discover_tasks(tasks_dir)
+    if args.only:
+        try:
+            benchmarks = select_tasks(benchmarks, args.only)
+        except ValueError as e:
+            parser.error(str(e))
 
     if not benchmarks:
         logger.error("No benchmarks found")
         sys.exit(1)
 
+    if args.list:
+        logger.info(f"{'Benchmark':<20} {'Feature':<12} {'Aspect':<30} {'Judge'}")
+        for b in benchmarks:
+            logger.info(f"{b['name']:<20} {b['feature']:<12} {b['aspect']:<30} {'yes' if b['judge'] else ''}")
+        return
+
     logger.info(f"Found {len(benchmarks)} benchmark(s): {', '.join(b['name'] for b in benchmarks)}")
-    logger.info(f"Model: {args.model}")
-    logger.info(f"API: http://{args.host}:{args.port}")
-    logger.info(f"Judge API: http://{args.judge_host}:{args.judge_port}")
+
+    if args.compile:
+        compile_prompts(benchmarks, task_options)
+        return
+
+    # Each model's replicas and budget are keyed by its first endpoint and its name, so models (and the
+    # judge, keyed by its URL alone) that share a server never route requests to each other's replicas.
+    judge_url = f"http://{args.judge_host}:{args.judge_port}/v1"
+    replicas = {judge_url: [endpoint_url(e) for e in args.judge_endpoint] or [judge_url]}
+    targets = {}
+    for model in args.model:
+        targets[model] = (args.host, args.port)
+        replicas[(f"http://{args.host}:{args.port}/v1", model)] = [endpoint_url(e) for e in args.endpoint] or [f"http://{args.host}:{args.port}/v1"]
+    for model, endpoints in models.items():
+        parts = urlsplit(endpoints[0])
+        targets[model] = (parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        replicas[(f"http://{targets[model][0]}:{targets[model][1]}/v1", model)] = endpoints
+
+    try:
+        swept = {b['name'] for b in select_tasks(benchmarks, args.sweep)} if args.sweep else set()
+        variants = {b['name']: benchmark_variants(b) if b['name'] in swept else [{}] for b in benchmarks}
+    except ValueError as e:
+        parser.error(str(e))
+
+    multi_model = len(targets) > 1
+    runs = []
+    for b in benchmarks:
+        for variant in variants[b['name']]:
+            name = f"{b['name']}[{variant_tag(variant)}]" if variant else b['name']
+            for model, (host, port) in targets.items():
+                runs.append({'benchmark': b, 'variant': variant, 'name': name, 'model': model, 'host': host, 'port': port,
+                             'label': f"{name}@{model}" if multi_model else name})
+
+    if args.shards:
+        try:
+            args.merge = launch_shards(sys.argv[1:], args.shards, Path(args.journal_dir) / "shards")
+        except RuntimeError as e:
+            logger.error(str(e))
+            sys.exit(1)
+    if args.merge:
+        try:
+            merged_letters = merge_shards(args.merge, runs, args.journal_dir)
+        except (ValueError, OSError) as e:
+            parser.error(str(e))
+        logger.info(f"Merged {len(args.merge)} shard(s): {', '.join(map(str, args.merge))}")
+    if args.shard is not None:
+        logger.info(f"Shard: {args.shard[0]}/{args.shard[1]}")
+
+    for model, (host, port) in targets.items():
+        logger.info(f"Model: {model} at {', '.join(replicas[(f'http://{host}:{port}/v1', model)])}")
+    if any(b['judge'] for b in benchmarks):
+        logger.info(f"Judge API: {', '.join(replicas[judge_url])}")
+    batch_mode = bool(args.export_batch or args.import_batch)
+    if batch_mode:
+        logger.info(f"Batch: {'answers from ' + ', '.join(args.import_batch) if args.import_batch else 'no answers yet'}"
+                    f"{', unanswered requests to ' + args.export_batch if args.export_batch else ''}")
+    logger.info(f"Cache: {'disabled' if args.no_cache or batch_mode or args.merge else args.cache_dir}")
+    logger.info(f"Journal: {args.journal_dir}{' (resuming)' if args.resume else ''}")
+    budgets = {url: args.concurrency * len(urls) for url, urls in replicas.items()}
+    budgets[judge_url] = args.judge_concurrency * len(replicas[judge_url])
+    pool_size = args.pool_size or sum(budgets.values())
+    logger.info(f"Concurrency: {args.concurrency} target, {args.judge_concurrency} judge, {args.parallel} benchmark(s) at once")
+    logger.info(f"Transport: {pool_size} pooled connection(s), {args.keepalive:g}s keep-alive, {'HTTP/2 offered' if args.http2 else 'HTTP/1.1'}, "
+                f"{args.connect_timeout:g}s connect / {args.read_timeout:g}s read timeout")
+    if args.ci_width is not None:
+        logger.info(f"Early stopping: {args.confidence:.0%} {args.ci_method} interval at most {args.ci_width} wide (seed {args.seed})")
     logger.info("-" * 60)
 
-    results = []
-    for benchmark in tqdm(benchmarks, desc="Running benchmarks", unit="benchmark"):
-        tqdm.write(f"\n{benchmark['name']}...")
+    from narrabench.batch import BatchExchange
+    from narrabench.cache import ResponseCache
+    from narrabench.engine import Engine
+    from narrabench.transport import Transport
+
+    cache = None if args.no_cache or batch_mode or args.merge else ResponseCache(Path(args.cache_dir), max_bytes=args.cache_size * 1024 * 1024)
+    batch = BatchExchange(args.import_batch, args.export_batch) if batch_mode else None
+
+    # A shard always keeps its trace in its journal directory, so that --merge can total its telemetry;
+    # the merge writes the combined trace to --profile.
+    trace_path = Path(args.journal_dir) / "telemetry.jsonl" if args.shard else args.profile
+    telemetry = Telemetry(trace_path=trace_path)
+    for shard_dir in args.merge or []:
+        if (Path(shard_dir) / "telemetry.jsonl").exists():
+            telemetry.load(Path(shard_dir) / "telemetry.jsonl")
+    transport = Transport(pool_size=pool_size, keepalive=args.keepalive, http2=args.http2,
+                          connect_timeout=args.connect_timeout, read_timeout=args.read_timeout)
+
+    with Engine(concurrency=args.concurrency, budgets=budgets, cache=cache, prefix_threshold=args.prefix_threshold,
+                telemetry=telemetry, stream=args.stream, replicas=replicas, max_retries=args.max_retries,
+                adaptive=not args.fixed_concurrency, transport=transport,
+                # While merging, an exchange without answers or an export directory: nothing is sent.
+                batch=BatchExchange() if args.merge else batch) as engine, \
+            ThreadPoolExecutor(max_workers=args.parallel) as pool:
         try:
-            wrapper = load_wrapper(benchmark['wrapper'])
-            accuracy = wrapper.run_benchmark(args.model, args.host, args.port, args.judge_host, args.judge_port)
-            taxonomy = BENCHMARK_TAXONOMY.get(benchmark['name'], {'feature': 'Unknown', 'aspect': 'Unknown'})
-            results.append({
-                'benchmark': benchmark['name'],
-                'model': args.model,
-                'feature': taxonomy['feature'],
-                'aspect': taxonomy['aspect'],
-                'accuracy': accuracy
-            })
-            tqdm.write(f"  ✓ {accuracy:.4f}")
-        except Exception as e:
-            tqdm.write(f"  ✗ Error: {e}")
-            taxonomy = BENCHMARK_TAXONOMY.get(benchmark['name'], {'feature': 'Unknown', 'aspect': 'Unknown'})
-            results.append({
-                'benchmark': benchmark['name'],
-                'model': args.model,
-                'feature': taxonomy['feature'],
-                'aspect': taxonomy['aspect'],
-                'accuracy': None
-            })
+            outcomes = run_pass(pool, runs, args, engine, task_options, args.resume or bool(args.merge),
+                                "Merging shards" if args.merge else "Running benchmarks")
+            for _ in range(0 if batch_mode or args.merge else args.retry_failed):
+                failed = [run for run in runs if engine.dead_letters.get(run['label'])]
+                if not failed:
+                    break
+                logger.info(f"Retrying {sum(len(engine.dead_letters.pop(run['label'])) for run in failed)} failed request(s) in {', '.join(run['label'] for run in failed)}")
+                outcomes.update(run_pass(pool, failed, args, engine, task_options, True, "Retrying failed examples"))
+        except KeyboardInterrupt:
+            # Wake the benchmark threads blocked on the engine so the pool and the engine can shut down.
+            logger.info("\nInterrupted; scored examples are in the journal, rerun with --resume to continue")
+            engine.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+            telemetry.close()
+            sys.exit(130)
+        dead_letters = merged_letters if args.merge else {run['label']: engine.dead_letters.get(run['label'], []) for run in runs}
+
+    telemetry.close()
+    if batch is not None:
+        batch.close()
+        for run in runs:
+            if batch.deferred[run['label']]:
+                outcomes[run['label']] = {**outcomes[run['label']], 'accuracy': None}
+    results = [result_row(run['benchmark'], run['variant'], run['model'], outcomes[run['label']], len(dead_letters[run['label']]), telemetry.summary(run['label'])) for run in runs]
 
     logger.info(f"\n{'=' * 60}")
     with open(args.output, 'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=['benchmark', 'model', 'feature', 'aspect', 'accuracy'])
+        writer = csv.DictWriter(f, fieldnames=['benchmark', 'variant', 'model', 'feature', 'aspect', 'accuracy', 'ci_low', 'ci_high', 'examples', 'failed'] + SUMMARY_FIELDS)
         writer.writeheader()
         writer.writerows(results)
 
-    logger.info(f"\n{'Benchmark':<20} {'Accuracy':<10}")
-    logger.info("-" * 30)
+    width = max([20] + [len(run['name']) + 1 for run in runs])
+    logger.info(f"\n{'Benchmark':<{width}} {'Accuracy':<10} {'Interval':<16} {'Examples':>8} {'Out tok/req':>11} {'Prompt tokens':>14} {'Prefix cached':>14} {'p50 (s)':>8} {'p95 (s)':>8} {'req/s':>8}{'  Model' if multi_model else ''}")
+    logger.info("-" * (width + 106))
     for r in results:
-        acc = f"{r['accuracy']:.4f}" if r['accuracy'] is not None else "ERROR"
-        logger.info(f"{r['benchmark']:<20} {acc:<10}")
+        name = f"{r['benchmark']}[{r['variant']}]" if r['variant'] else r['benchmark']
+        acc = f"{r['accuracy']:.4f}" if r['accuracy'] is not None else "PENDING" if r['examples'] is not None else "ERROR"
+        interval = f"[{r['ci_low']:.3f}, {r['ci_high']:.3f}]" if r['ci_low'] is not None else "-"
+        examples = r['examples'] if r['examples'] is not None else "-"
+        decoded = f"{r['completion_tokens_per_request']:.1f}" if r['completion_tokens_per_request'] is not None else "-"
+        p50 = f"{r['latency_p50']:.3f}" if r['latency_p50'] is not None else "-"
+        p95 = f"{r['latency_p95']:.3f}" if r['latency_p95'] is not None else "-"
+        rps = f"{r['requests_per_s']:.1f}" if r['requests_per_s'] is not None else "-"
+        logger.info(f"{name:<{width}} {acc:<10} {interval:<16} {examples:>8} {decoded:>11} {r['prompt_tokens']:>14} {r['cached_ratio']:>14.1%} {p50:>8} {p95:>8} {rps:>8}{'  ' + r['model'] if multi_model else ''}")
+
+    if any(len(urls) > 1 for urls in replicas.values()):
+        logger.info(f"\n{'Replica':<40} {'Requests':>9} {'Errors':>7} {'p50 (s)':>8} {'p95 (s)':>8}")
+        logger.info("-" * 76)
+        for url, r in telemetry.replicas().items():
+            p50 = f"{r['latency_p50']:.3f}" if r['latency_p50'] is not None else "-"
+            p95 = f"{r['latency_p95']:.3f}" if r['latency_p95'] is not None else "-"
+            logger.info(f"{url:<40} {r['requests']:>9} {r['errors']:>7} {p50:>8} {p95:>8}")
+
+    if any(dead_letters.values()):
+        logger.info("\nFailed requests (not counted in accuracy):")
+    for run in runs:
+        letters = dead_letters[run['label']]
+        path = journal_path(args.journal_dir, run['model'], run['name']).with_suffix('.failed.jsonl')
+        if letters:
+            write_dead_letters(path, letters)
+            logger.info(f"  {run['label']}: {len(letters)} ({letters[-1]['error']}), see {path}")
+        else:
+            path.unlink(missing_ok=True)
+
+    if batch is not None:
+        logger.info(f"\nBatch: {sum(batch.answered.values())} request(s) answered from batch output")
+        for run in runs:
+            if batch.deferred[run['label']]:
+                logger.info(f"  {run['label']}: {batch.deferred[run['label']]} request(s) waiting for a batch answer (accuracy left empty)")
+        for path, count in batch.exported.items():
+            logger.info(f"  {count} request(s) written to {path}")
+        if batch.exported:
+            logger.info("Run each file through a batch runner (e.g. `vllm run-batch -i FILE -o OUTPUT --model MODEL`) and rerun with --import-batch OUTPUT")
+
+    wire = transport.summary()
+    if wire['requests']:
+        protocols = ', '.join(f"{count} {protocol}" for protocol, count in sorted(wire['protocols'].items()))
+        logger.info(f"\nTransport: {wire['requests']} request(s) over {wire['connections']} connection(s) ({wire['reuse']:.1%} reused; {protocols}), "
+                    f"socket wait p50 {wire['socket_wait_p50'] * 1000:.1f} ms, p95 {wire['socket_wait_p95'] * 1000:.1f} ms")
+
+    if cache is not None:
+        logger.info(f"\nCache: {cache.summary()}")
+        cache.close()
+    # A shard's results are partial; the merge records the whole run.
+    if not args.no_results_db and args.shard is None:
+        from narrabench.results import ResultsStore
+
+        store = ResultsStore(Path(args.results_db))
+        predictions = {(r['benchmark'], r['variant'], r['model']): journal_predictions(run, args.journal_dir, task_options.get(run['benchmark']['name'], {}))
+                       for run, r in zip(runs, results)}
+        run_id = store.record_run(started, " ".join(sys.argv), vars(args), results, predictions)
+        store.close()
+        logger.info(f"\nRecorded as run {run_id} in {args.results_db} ({sum(map(len, predictions.values()))} prediction(s)); compare runs with query.py")
 
+    if args.shard is not None:
+        with open(Path(args.journal_dir) / SHARD_MARKER, 'w') as f:
+            json.dump({'index': args.shard[0], 'count': args.shard[1], 'runs': [run['label'] for run in runs]}, f)
+        logger.info(f"\nShard {args.shard[0]}/{args.shard[1]} finished; combine all {args.shard[1]} with --merge")
     logger.info(f"\nResults: {args.output}")
+    if trace_path:
+        logger.info(f"Trace: {trace_path}")
 
 
 if __name__ == '__main__':
@@ -1,9 +1,20 @@
-"""Setup all benchmarks"""
+"""Setup all benchmarks
 
+Each task's `setup.py` runs in its own process, several at a time. Archives
+are downloaded into a shared cache, resumed if interrupted and verified
+against the `sha256` pinned in the task's `task.toml` (see narrabench/fetch.py).
+"""
+
+import argparse
 import logging
-from pathlib import Path
+import os
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from narrabench.fetch import DEFAULT_CACHE_DIR
+from narrabench.registry import select_tasks
 
 logging.basicConfig(
     level=logging.INFO,
@@ -13,20 +24,53 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-tasks_dir = Path(__file__).parent / "tasks"
-benchmarks = [d for d in tasks_dir.iterdir() if d.is_dir()]
+root_dir = Path(__file__).resolve().parent
+tasks_dir = root_dir / "tasks"
+
+
+def setup_task(benchmark: Path, env: dict) -> bool:
+    logger.info(f"Setting up {benchmark.name}")
+    result = subprocess.run([sys.executable, str(benchmark / "setup.py")], env=env)
+    if result.returncode != 0:
+        logger.error(f"Failed to setup {benchmark.name}")
+        return False
+    logger.info(f"Done setting up {benchmark.name}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download and unpack the benchmark data")
+    parser.add_argument("--jobs", type=int, default=4, help="Number of tasks to set up at once")
+    parser.add_argument("--only", type=str, default=None, help="Comma-separated benchmark names to set up")
+    parser.add_argument("--cache-dir", type=str, default=str(DEFAULT_CACHE_DIR), help="Directory downloaded archives are kept in")
+    parser.add_argument("--mirror", type=str, default=None,
+                        help="Directory laid out like the download cache to copy archives from before trying the network")
+    args = parser.parse_args()
+
+    benchmarks = [{'name': d.name, 'path': d} for d in sorted(tasks_dir.iterdir()) if (d / "setup.py").exists()]
+    if args.only:
+        try:
+            benchmarks = select_tasks(benchmarks, args.only)
+        except ValueError as e:
+            parser.error(str(e))
 
-for benchmark in sorted(benchmarks):
-    setup_script = benchmark / "setup.py"
-    if setup_script.exists():
-        logger.info(f"Setting up {benchmark.name}")
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(root_dir), os.environ.get("PYTHONPATH")])),
+        "NARRABENCH_DOWNLOAD_CACHE": str(Path(args.cache_dir).resolve()),
+    }
+    if args.mirror:
+        env["NARRABENCH_MIRROR"] = str(Path(args.mirror).resolve())
 
-        result = subprocess.run([sys.executable, str(setup_script)])
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        results = list(pool.map(lambda benchmark: setup_task(benchmark['path'], env), benchmarks))
 
-        if result.returncode != 0:
-            logger.error(f"Failed to setup {benchmark.name}")
-            sys.exit(1)
+    failed = [benchmark['name'] for benchmark, ok in zip(benchmarks, results) if not ok]
+    if failed:
+        logger.error(f"Failed to set up: {', '.join(failed)}")
+        sys.exit(1)
+    logger.info("All benchmarks set up successfully")
 
-        logger.info(f"Done downloading {benchmark.name}")
 
-logger.info("All benchmarks set up successfully")
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,18 @@
-import csv
 import logging
 from pathlib import Path
-from openai import OpenAI
 import re
 
+from narrabench.data import read_delimited
+from narrabench.engine import Engine, message_content
+from narrabench.journal import Journal
+from narrabench.pipeline import judge_pipeline
+from narrabench.prompts import precompiled
+from narrabench.sampling import Sampler
+
 logger = logging.getLogger(__name__)
 
+DATA_PATH = Path(__file__).parent / "austenalike-original" / "expert_benchmark" / "expert-benchmark.csv"
+
 CHARACTERS = [
     "Anna Weston", "Augusta Elton", "Emma Woodhouse", "Frank Churchill", "George Knightley",
     "Harriet Smith", "Isabella Knightley", "Jane Fairfax", "John Knightley", "Miss Bates",
@@ -32,83 +39,164 @@ CHARACTERS = [
 ]
 
 
+ALIASES = {
+    "Emma": "Emma Woodhouse", "Mr. Knightley": "George Knightley", "Mr. Elton": "Philip Elton",
+    "Mrs. Elton": "Augusta Elton", "Mrs. Weston": "Anna Weston", "Mr. Darcy": "Fitzwilliam Darcy",
+    "Darcy": "Fitzwilliam Darcy", "Mr. Bingley": "Charles Bingley", "Miss Bingley": "Caroline Bingley",
+    "Mr. Wickham": "George Wickham", "Wickham": "George Wickham", "Mr. Collins": "William Collins",
+    "Lady Catherine": "Lady Catherine de Bourgh", "Mr. Willoughby": "John Willoughby",
+    "Willoughby": "John Willoughby", "Sir Thomas": "Sir Thomas Bertram", "Mr. Crawford": "Henry Crawford",
+    "Miss Crawford": "Mary Crawford", "Miss Tilney": "Eleanor Tilney", "Sir Walter": "Sir Walter Elliot",
+    "Mr. Elliot": "William Elliot", "Frederick Wentworth": "Captain Wentworth", "Wentworth": "Captain Wentworth",
+    "Brandon": "Colonel Brandon",
+}
+
+
 def get_character_list_text():
     return "\n".join([f"{i+1}. {char}" for i, char in enumerate(CHARACTERS)])
 
 
-def run_benchmark(model: str, host: str, port: int, judge_host: str = None, judge_port: int = None) -> float:
-    if not judge_host or not judge_port:
-        raise ValueError("AustenAlike requires judge model. Provide --judge-host and --judge-port")
+def normalize_name(text: str) -> str:
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
 
-    data_path = Path(__file__).parent / "austenalike-original" / "expert_benchmark" / "expert-benchmark.csv"
-    if not data_path.exists():
-        raise FileNotFoundError(f"Data file not found: {data_path}")
 
-    test_client = OpenAI(base_url=f"http://{host}:{port}/v1", api_key="dummy")
-    judge_client = OpenAI(base_url=f"http://{judge_host}:{judge_port}/v1", api_key="dummy")
+NAME_PATTERNS = [
+    (re.compile(rf"\b{re.escape(normalize_name(name))}\b"), canonical)
+    for name, canonical in [(char, char) for char in CHARACTERS] + list(ALIASES.items())
+]
+
 
-    with open(data_path, 'r') as f:
-        reader = csv.DictReader(f)
-        data = [row for row in reader if int(row['Count']) > 0]
+def resolve_character(predicted: str):
+    """Return the one character `predicted` names, by full name or alias, or None if it names none or several.
+
+    A match inside a longer match (Darcy in Georgiana Darcy) does not count.
+    """
+    text = normalize_name(predicted)
+    matches = [(m.start(), m.end(), canonical) for pattern, canonical in NAME_PATTERNS for m in pattern.finditer(text)]
+    named = {
+        canonical for start, end, canonical in matches
+        if not any(s <= start and end <= e and (s, e) != (start, end) for s, e, _ in matches)
+    }
+    return named.pop() if len(named) == 1 else None
+
+
+def settle(char1: str, char2: str, predicted: str):
+    """Decide a prediction without the judge where possible; None means the judge is needed."""
+    if char2.lower() in predicted.lower():
+        return True
+    resolved = resolve_character(predicted)
+    if resolved == char2:
+        return True
+    if resolved == char1:
+        return False
+    return None
+
+
+@precompiled(DATA_PATH)
+def load_examples() -> list:
+    if not DATA_PATH.exists():
+        raise FileNotFoundError(f"Data file not found: {DATA_PATH}")
 
     character_list = get_character_list_text()
-    correct = 0
-    total = 0
+    examples = []
 
-    for row in data[:100]:
+    for i, row in enumerate(read_delimited(DATA_PATH, limit=100, where=lambda row: int(row['Count']) > 0)):
         char1 = row['Character']
         char2 = row['Character2']
 
         if char1 not in CHARACTERS or char2 not in CHARACTERS:
             continue
 
-        char1_idx = CHARACTERS.index(char1) + 1
-
         question = f"Based on your knowledge of Jane Austen's novels, which character from the list is {char1} most similar to in terms of personality, social role, or narrative function? Respond with only the character name. Do not choose {char1} themselves."
 
+        examples.append({
+            'id': str(i),
+            'messages': [
+                {"role": "system", "content": f"You are an expert on Jane Austen's novels. Consider the following list of characters from Emma, Mansfield Park, Northanger Abbey, Persuasion, Pride and Prejudice, and Sense and Sensibility:\n\n{character_list}\n\nUse your knowledge of these characters' personalities, roles, and story arcs to determine similarity."},
+                {"role": "user", "content": question}
+            ],
+            'gold': {'char1': char1, 'char2': char2},
+        })
+    return examples
+
+
+def run_benchmark(model: str, host: str, port: int, judge_host: str = None, judge_port: int = None, engine: Engine = None, journal: Journal = None, sampler: Sampler = None) -> float:
+    if not judge_host or not judge_port:
+        raise ValueError("AustenAlike requires judge model. Provide --judge-host and --judge-port")
+
+    if engine is None:
+        with Engine() as engine:
+            return run_benchmark(model, host, port, judge_host, judge_port, engine=engine, journal=journal, sampler=sampler)
+    if journal is None:
+        journal = Journal()
+    sampler = sampler or Sampler()
+
+    examples = sampler.order(load_examples())
+    ids = [example['id'] for example in examples]
+    pending = [example for example in examples if example['id'] not in journal]
+    requests = [
+        {
+            "model": model,
+            "messages": example['messages'],
+            "temperature": 0.0,
+            "max_tokens": 50
+        }
+        for example in pending
+    ]
+
+    predictions = {}
+    settled = 0
+
+    def prepare(index, response):
+        nonlocal settled
+        example = pending[index]
+        char1, char2 = example['gold']['char1'], example['gold']['char2']
         try:
-            response = test_client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": f"You are an expert on Jane Austen's novels. Consider the following list of characters from Emma, Mansfield Park, Northanger Abbey, Persuasion, Pride and Prejudice, and Sense and Sensibility:\n\n{character_list}\n\nUse your knowledge of these characters' personalities, roles, and story arcs to determine similarity."},
-                    {"role": "user", "content": question}
-                ],
-                temperature=0.0,
-                max_tokens=50
-            )
+            predicted = message_content(response).strip()
+        except Exception as e:
+            logger.error(f"    Error: {e}")
+            return None
 
-            predicted = response.choices[0].message.content.strip()
+        verdict = settle(char1, char2, predicted)
+        if verdict is not None:
+            journal.record(example['id'], predicted, verdict)
+            settled += 1
+            return None
 
-            judge_prompt = f"""Given that an expert rated {char2} as similar to {char1}, evaluate if the prediction "{predicted}" is reasonable.
+        predictions[index] = predicted
+        judge_prompt = f"""Given that an expert rated {char2} as similar to {char1}, evaluate if the prediction "{predicted}" is reasonable.
 
 Expert similar character: {char2}
 Model prediction: {predicted}
 
 Is the prediction the same character or a reasonable similar character? Answer only: YES or NO"""
 
-            judge_response = judge_client.chat.completions.create(
-                model="gpt-oss-20b",
-                messages=[
-                    {"role": "system", "content": "You are an expert on Jane Austen characters evaluating character similarity predictions."},
-                    {"role": "user", "content": judge_prompt}
-                ],
-                temperature=0.0,
-                max_tokens=10
-            )
-
-            judgment = judge_response.choices[0].message.content.strip().upper()
-
-            if "YES" in judgment or char2.lower() in predicted.lower():
-                correct += 1
+        return (char1, char2, normalize_name(predicted)), {
+            "model": "gpt-oss-20b",
+            "messages": [
+                {"role": "system", "content": "You are an expert on Jane Austen characters evaluating character similarity predictions."},
+                {"role": "user", "content": judge_prompt}
+            ],
+            "temperature": 0.0,
+            "max_tokens": 10
+        }
+
+    def on_judgment(index, judge_response):
+        try:
+            judgment = message_content(judge_response).strip().upper()
+            journal.record(pending[index]['id'], predictions[index], "YES" in judgment)
+        except Exception as e:
+            logger.error(f"    Error: {e}")
 
-            total += 1
+    stats = judge_pipeline(engine, f"http://{host}:{port}/v1", requests, f"http://{judge_host}:{judge_port}/v1",
+                           prepare, on_judgment, log_every=20, stop=sampler.stopper(journal, ids))
 
-            if total % 20 == 0:
-                logger.info(f"    {total}/100")
+    logger.info(f"    Judge: {stats['judged']} call(s), {settled + stats['shared']} saved ({settled} settled without judge, {stats['shared']} memoized)")
 
-        except Exception as e:
-            logger.error(f"    Error: {e}")
-            continue
+    verdicts = journal.verdicts(ids)
+    correct = sum(verdicts)
+    total = len(verdicts)
 
     accuracy = correct / total if total > 0 else 0.0
     logger.info(f"    {total} examples, {correct} correct")
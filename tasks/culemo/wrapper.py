@@ -1,81 +1,186 @@
-import csv
+import json
 import logging
 from pathlib import Path
-from openai import OpenAI
+
+from narrabench.data import read_delimited
+from narrabench.engine import LOGPROB_PARAMS, Engine, message_content, option_probabilities, top_option
+from narrabench.journal import Journal
+from narrabench.prompts import precompiled
+from narrabench.sampling import Sampler
 
 logger = logging.getLogger(__name__)
 
+DATA_PATH = Path(__file__).parent / "culemo-original" / "data" / "test" / "eng.tsv"
+
+EMOTIONS = ['joy', 'sadness', 'anger', 'fear', 'disgust', 'surprise', 'guilt', 'shame']
+SENTIMENTS = ['positive', 'negative', 'neutral']
+
 
 def normalize_answer(answer: str) -> str:
     return answer.strip().lower()
 
 
-def run_benchmark(model: str, host: str, port: int, judge_host: str = None, judge_port: int = None) -> float:
-    data_path = Path(__file__).parent / "culemo-original" / "data" / "test" / "eng.tsv"
-    if not data_path.exists():
-        raise FileNotFoundError(f"Data file not found: {data_path}")
+def score(row: dict, emotion_text: str, sentiment_text: str) -> dict:
+    predicted_emotion = normalize_answer(emotion_text)
+    predicted_sentiment = normalize_answer(sentiment_text)
 
-    client = OpenAI(base_url=f"http://{host}:{port}/v1", api_key="dummy")
+    gt_emotion = normalize_answer(row['emotion_eng'])
+    gt_sentiment = normalize_answer(row['sentiment_eng'])
 
-    with open(data_path, 'r') as f:
-        reader = csv.DictReader(f, delimiter='\t')
-        data = list(reader)
+    return {
+        'emotion': gt_emotion in predicted_emotion or predicted_emotion in gt_emotion,
+        'sentiment': gt_sentiment in predicted_sentiment or predicted_sentiment in gt_sentiment,
+    }
 
-    correct_emotion = 0
-    correct_sentiment = 0
-    total = 0
 
-    for row in data[:1000]:
-        text = row['text_eng']
-        emotion_label = row['emotion_eng']
-        sentiment_label = row['sentiment_eng']
+def parse_fused(answer_text: str) -> tuple:
+    """Return the (emotion, sentiment) labels of a fused JSON answer, or None unless both are non-empty strings.
 
-        try:
-            emotion_response = client.chat.completions.create(
-                model=model,
-                messages=[
+    `score` counts an empty label as a match, since it is a substring of every
+    label, so fused answers without both labels are rejected here.
+    """
+    try:
+        parsed = json.loads(answer_text)
+    except (json.JSONDecodeError, TypeError):
+        return None
+    if not isinstance(parsed, dict):
+        return None
+    emotion, sentiment = parsed.get('emotion'), parsed.get('sentiment')
+    if not isinstance(emotion, str) or not isinstance(sentiment, str) or not emotion.strip() or not sentiment.strip():
+        return None
+    return emotion, sentiment
+
+
+@precompiled(DATA_PATH)
+def load_examples(mode: str = 'pair') -> list:
+    """Return the examples with their prompts: emotion then sentiment in `pair` mode, one JSON question in `fused` mode."""
+    if not DATA_PATH.exists():
+        raise FileNotFoundError(f"Data file not found: {DATA_PATH}")
+
+    examples = []
+    for i, row in enumerate(read_delimited(DATA_PATH, limit=1000, delimiter='\t')):
+        text = row['text_eng']
+        if mode == 'fused':
+            prompts = [[
+                {"role": "system", "content": "You are a helpful assistant that predicts emotions and analyzes sentiment. Answer with only a JSON object with two fields: 'emotion' (one of joy, sadness, anger, fear, disgust, surprise, guilt, shame) and 'sentiment' (one of positive, negative, neutral)."},
+                {"role": "user", "content": f"{text}\n\nWhat emotion does this express, and what is the sentiment?"}
+            ]]
+        else:
+            prompts = [
+                [
                     {"role": "system", "content": "You are a helpful assistant that predicts emotions. Answer with only one word: the emotion label."},
                     {"role": "user", "content": f"{text}\n\nWhat emotion does this express? (joy, sadness, anger, fear, disgust, surprise, guilt, shame)"}
                 ],
-                temperature=0.0,
-                max_tokens=10
-            )
-
-            sentiment_response = client.chat.completions.create(
-                model=model,
-                messages=[
+                [
                     {"role": "system", "content": "You are a helpful assistant that analyzes sentiment. Answer with only one word: positive, negative, or neutral."},
                     {"role": "user", "content": f"{text}\n\nWhat is the sentiment?"}
                 ],
-                temperature=0.0,
-                max_tokens=10
-            )
-
-            predicted_emotion = normalize_answer(emotion_response.choices[0].message.content)
-            predicted_sentiment = normalize_answer(sentiment_response.choices[0].message.content)
-
-            gt_emotion = normalize_answer(emotion_label)
-            gt_sentiment = normalize_answer(sentiment_label)
-
-            if gt_emotion in predicted_emotion or predicted_emotion in gt_emotion:
-                correct_emotion += 1
-
-            if gt_sentiment in predicted_sentiment or predicted_sentiment in gt_sentiment:
-                correct_sentiment += 1
+            ]
+        examples.append({
+            'id': str(i),
+            'prompts': prompts,
+            'gold': {'emotion_eng': row['emotion_eng'], 'sentiment_eng': row['sentiment_eng']},
+        })
+    return examples
+
+
+def run_benchmark(model: str, host: str, port: int, judge_host: str = None, judge_port: int = None, engine: Engine = None, journal: Journal = None, sampler: Sampler = None, mode: str = 'pair', scoring: str = 'generate') -> float:
+    if mode not in ('pair', 'fused'):
+        raise ValueError(f"Unknown CuLEmo mode: {mode}. Use 'pair' or 'fused'")
+    if scoring not in ('generate', 'logprobs'):
+        raise ValueError(f"Unknown CuLEmo scoring: {scoring}. Use 'generate' or 'logprobs'")
+    if mode == 'fused' and scoring == 'logprobs':
+        raise ValueError("CuLEmo logprobs scoring needs pair mode: a fused JSON answer is not one token")
+
+    if engine is None:
+        with Engine() as engine:
+            return run_benchmark(model, host, port, judge_host, judge_port, engine=engine, journal=journal, sampler=sampler, mode=mode, scoring=scoring)
+    if journal is None:
+        journal = Journal()
+    sampler = sampler or Sampler()
+
+    examples = sampler.order(load_examples(mode), stratify=lambda example: example['gold']['emotion_eng'])
+    ids = [example['id'] for example in examples]
+    pending = [example for example in examples if example['id'] not in journal]
+    requests = []
+
+    for example in pending:
+        if mode == 'fused':
+            requests.append({
+                "model": model,
+                "messages": example['prompts'][0],
+                "response_format": {"type": "json_object"},
+                "temperature": 0.0,
+                "max_tokens": 30
+            })
+            continue
 
-            total += 1
+        for messages in example['prompts']:
+            requests.append({
+                "model": model,
+                "messages": messages,
+                "temperature": 0.0,
+                **(LOGPROB_PARAMS if scoring == 'logprobs' else {"max_tokens": 10})
+            })
+
+    answers = {}
+
+    def on_pair(index, response):
+        position, question = divmod(index, 2)
+        pair = answers.setdefault(position, [None, None])
+        pair[question] = response
+        if pair[0] is None or pair[1] is None:
+            return
+        del answers[position]
+
+        example = pending[position]
+        try:
+            if scoring == 'logprobs':
+                emotion_probabilities = option_probabilities(pair[0], EMOTIONS)
+                sentiment_probabilities = option_probabilities(pair[1], SENTIMENTS)
+                emotion, sentiment = top_option(emotion_probabilities), top_option(sentiment_probabilities)
+                journal.record(example['id'], {
+                    'emotion': emotion,
+                    'sentiment': sentiment,
+                    'probabilities': {'emotion': emotion_probabilities, 'sentiment': sentiment_probabilities},
+                }, {
+                    'emotion': emotion == normalize_answer(example['gold']['emotion_eng']),
+                    'sentiment': sentiment == normalize_answer(example['gold']['sentiment_eng']),
+                })
+                return
+            emotion_text = message_content(pair[0])
+            sentiment_text = message_content(pair[1])
+            journal.record(example['id'], {'emotion': emotion_text, 'sentiment': sentiment_text}, score(example['gold'], emotion_text, sentiment_text))
+        except Exception as e:
+            logger.error(f"    Error: {e}")
 
-            if total % 50 == 0:
-                logger.info(f"    {total}/{min(len(data), 1000)}")
+    def on_fused(index, response):
+        example = pending[index]
+        try:
+            answer_text = message_content(response)
+            labels = parse_fused(answer_text)
+            if labels is None:
+                verdict = {'emotion': False, 'sentiment': False}
+            else:
+                verdict = score(example['gold'], *labels)
+            journal.record(example['id'], answer_text, verdict)
         except Exception as e:
             logger.error(f"    Error: {e}")
-            continue
+
+    on_result = on_fused if mode == 'fused' else on_pair
+    stop = sampler.stopper(journal, ids, value=lambda verdict: (verdict['emotion'] + verdict['sentiment']) / 2)
+    engine.complete(f"http://{host}:{port}/v1", requests, log_every=100, on_result=on_result, stop=stop)
+
+    verdicts = journal.verdicts(ids)
+    correct_emotion = sum(v['emotion'] for v in verdicts)
+    correct_sentiment = sum(v['sentiment'] for v in verdicts)
+    total = len(verdicts)
 
     emotion_accuracy = correct_emotion / total if total > 0 else 0.0
     sentiment_accuracy = correct_sentiment / total if total > 0 else 0.0
     combined_accuracy = (emotion_accuracy + sentiment_accuracy) / 2
 
-    logger.info(f"    {total} examples")
+    logger.info(f"    {total} examples ({mode} mode{', logprobs' if scoring == 'logprobs' else ''})")
     logger.info(f"    Emotion: {correct_emotion} correct ({emotion_accuracy:.4f})")
     logger.info(f"    Sentiment: {correct_sentiment} correct ({sentiment_accuracy:.4f})")
 
@@ -1,18 +1,10 @@
 """Setup script for PhantomWiki benchmark"""
 
-import urllib.request
-import zipfile
+import logging
 from pathlib import Path
 
-benchmark_dir = Path(__file__).parent
-original_repo_dir = benchmark_dir / "phantomwiki-original"
+from narrabench.fetch import fetch_task
 
-if not original_repo_dir.exists():
-    zip_path = benchmark_dir / "phantomwiki.zip"
-    urllib.request.urlretrieve("https://github.com/kilian-group/phantom-wiki/archive/refs/heads/main.zip", zip_path)
+logging.basicConfig(level=logging.INFO, format='%(message)s')
 
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(benchmark_dir)
-
-    (benchmark_dir / "phantom-wiki-main").rename(original_repo_dir)
-    zip_path.unlink()
+fetch_task(Path(__file__).parent)
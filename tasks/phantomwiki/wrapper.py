@@ -1,52 +1,103 @@
 import logging
+import os
 from pathlib import Path
-from openai import OpenAI
-from datasets import load_dataset
+
+from narrabench.data import head
+from narrabench.engine import Engine, message_content
+from narrabench.journal import Journal
+from narrabench.prompts import precompiled
+from narrabench.sampling import Sampler
 
 logger = logging.getLogger(__name__)
 
+DATASET = "kilian-group/phantom-wiki-v1"
 
-def run_benchmark(model: str, host: str, port: int, judge_host: str = None, judge_port: int = None) -> float:
-    logger.info("    Loading PhantomWiki dataset from HuggingFace...")
+# The Hugging Face hub cache records the commit each download of the main
+# branch resolved to, which is used when the hub can't be reached.
+HUB_CACHE = Path(os.environ.get("HF_HUB_CACHE", Path(os.environ.get("HF_HOME", Path.home() / ".cache" / "huggingface")) / "hub"))
+DATASET_REF = HUB_CACHE / f"datasets--{DATASET.replace('/', '--')}" / "refs" / "main"
 
-    ds_qa = load_dataset("kilian-group/phantom-wiki-v1", "question-answer", split="depth_20_size_50_seed_1")
-    ds_corpus = load_dataset("kilian-group/phantom-wiki-v1", "text-corpus", split="depth_20_size_50_seed_1")
 
-    corpus_text = "\n\n".join([f"{item['article']}" for item in ds_corpus])
+def dataset_revision() -> str:
+    """The dataset's current commit on the hub, or the one last downloaded when offline (None if neither is known)."""
+    try:
+        from huggingface_hub import HfApi
+        return HfApi().dataset_info(DATASET).sha
+    except Exception as e:
+        logger.debug(f"    Could not resolve the {DATASET} revision on the hub ({e})")
+        return DATASET_REF.read_text().strip() if DATASET_REF.exists() else None
 
-    client = OpenAI(base_url=f"http://{host}:{port}/v1", api_key="dummy")
 
-    correct = 0
-    total = 0
+def score(example: dict, answer_text: str) -> bool:
+    predicted = answer_text.strip().lower()
+    return any(ans.lower() in predicted for ans in example['answer'])
 
-    for example in list(ds_qa)[:1000]:
-        question = example['question']
-        answers = example['answer']
 
-        try:
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": f"You are a helpful assistant that answers questions based on the following information:\n\n{corpus_text}\n\nProvide concise, direct answers with just the name(s)."},
-                    {"role": "user", "content": question}
-                ],
-                temperature=0.0,
-                max_tokens=100
-            )
+def load_examples(revision: str = None) -> list:
+    """The examples of `revision` of the dataset, by default the one `dataset_revision` resolves."""
+    return load_revision(revision or dataset_revision())
+
+
+@precompiled()
+def load_revision(revision: str) -> list:
+    from datasets import load_dataset
+
+    logger.info("    Loading PhantomWiki dataset from HuggingFace...")
+
+    ds_qa = load_dataset(DATASET, "question-answer", split="depth_20_size_50_seed_1", revision=revision)
+    ds_corpus = load_dataset(DATASET, "text-corpus", split="depth_20_size_50_seed_1", revision=revision)
+
+    corpus_text = "\n\n".join(ds_corpus['article'])
+    system_prompt = f"You are a helpful assistant that answers questions based on the following information:\n\n{corpus_text}\n\nProvide concise, direct answers with just the name(s)."
 
-            predicted = response.choices[0].message.content.strip().lower()
+    rows = head(ds_qa, 1000).select_columns(['question', 'answer'])
+    return [
+        {
+            'id': str(i),
+            'messages': [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": row['question']}
+            ],
+            'gold': {'answer': row['answer']},
+        }
+        for i, row in enumerate(rows)
+    ]
 
-            if any(ans.lower() in predicted for ans in answers):
-                correct += 1
 
-            total += 1
+def run_benchmark(model: str, host: str, port: int, judge_host: str = None, judge_port: int = None, engine: Engine = None, journal: Journal = None, sampler: Sampler = None) -> float:
+    if engine is None:
+        with Engine() as engine:
+            return run_benchmark(model, host, port, judge_host, judge_port, engine=engine, journal=journal, sampler=sampler)
+    if journal is None:
+        journal = Journal()
+    sampler = sampler or Sampler()
 
-            if total % 20 == 0:
-                logger.info(f"    {total}/{min(len(ds_qa), 1000)}")
+    examples = sampler.order(load_examples())
+    ids = [example['id'] for example in examples]
+    pending = [example for example in examples if example['id'] not in journal]
+    requests = [
+        {
+            "model": model,
+            "messages": example['messages'],
+            "temperature": 0.0,
+            "max_tokens": 100
+        }
+        for example in pending
+    ]
 
+    def on_result(index, response):
+        example = pending[index]
+        try:
+            answer_text = message_content(response)
+            journal.record(example['id'], answer_text, score(example['gold'], answer_text))
         except Exception as e:
             logger.error(f"    Error: {e}")
-            continue
+
+    engine.complete(f"http://{host}:{port}/v1", requests, log_every=20, on_result=on_result, stop=sampler.stopper(journal, ids))
+
+    verdicts = journal.verdicts(ids)
+    correct = sum(verdicts)
+    total = len(verdicts)
 
     accuracy = correct / total if total > 0 else 0.0
     logger.info(f"    {total} examples, {correct} correct")
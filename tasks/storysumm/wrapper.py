@@ -1,75 +1,110 @@
-import json
 import logging
 from pathlib import Path
-from openai import OpenAI
+
+from narrabench.data import read_json
+from narrabench.engine import LOGPROB_PARAMS, Engine, message_content, option_probabilities, top_option
+from narrabench.journal import Journal
+from narrabench.prompts import precompiled
+from narrabench.sampling import Sampler
 
 logger = logging.getLogger(__name__)
 
+DATA_PATH = Path(__file__).parent / "storysumm-original" / "storysumm.json"
+SYSTEM_PROMPT_PATH = Path(__file__).parent / "storysumm-original" / "evaluators" / "systemprompt.txt"
 
-def run_benchmark(model: str, host: str, port: int, judge_host: str = None, judge_port: int = None) -> float:
-    data_path = Path(__file__).parent / "storysumm-original" / "storysumm.json"
-    if not data_path.exists():
-        raise FileNotFoundError(f"Data file not found: {data_path}")
+OPTIONS = ['Yes', 'No']
 
-    system_prompt_path = Path(__file__).parent / "storysumm-original" / "evaluators" / "systemprompt.txt"
-    if system_prompt_path.exists():
-        with open(system_prompt_path, 'r') as f:
-            system_prompt = f.read().strip()
+
+def score(item: dict, answer_text: str) -> bool:
+    answer = answer_text.strip().lower()
+
+    if answer.startswith('yes'):
+        predicted_label = 1
+    elif answer.startswith('no'):
+        predicted_label = 0
     else:
-        system_prompt = "You are a helpful assistant that evaluates story summaries for factual consistency."
+        if 'yes' in answer and 'no' not in answer:
+            predicted_label = 1
+        elif 'no' in answer and 'yes' not in answer:
+            predicted_label = 0
+        else:
+            predicted_label = 0
 
-    question = "Is all of the information in the summary consistent with the story? Ignore summary sentences that are just commentary/interpretation. You should answer Yes or No."
+    return predicted_label == item['label']
 
-    client = OpenAI(base_url=f"http://{host}:{port}/v1", api_key="dummy")
 
-    with open(data_path, 'r') as f:
-        data = json.load(f)
+@precompiled(DATA_PATH, SYSTEM_PROMPT_PATH)
+def load_examples() -> list:
+    if not DATA_PATH.exists():
+        raise FileNotFoundError(f"Data file not found: {DATA_PATH}")
+
+    if SYSTEM_PROMPT_PATH.exists():
+        with open(SYSTEM_PROMPT_PATH, 'r') as f:
+            system_prompt = f.read().strip()
+    else:
+        system_prompt = "You are a helpful assistant that evaluates story summaries for factual consistency."
 
-    correct = 0
-    total = 0
+    question = "Is all of the information in the summary consistent with the story? Ignore summary sentences that are just commentary/interpretation. You should answer Yes or No."
 
-    for key, item in list(data.items())[:1000]:
+    examples = []
+    for key, item in read_json(DATA_PATH, limit=1000):
         story = item['story'].strip()
         summary = ' '.join(item['summary'])
-        true_label = item['label']
-
-        try:
-            messages = [
+        examples.append({
+            'id': key,
+            'messages': [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": f"Story:\n{story}\n\nSummary:\n{summary}"},
                 {"role": "user", "content": question}
-            ]
-
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=0.0,
-                max_tokens=10
-            )
-
-            answer = response.choices[0].message.content.strip().lower()
-
-            if answer.startswith('yes'):
-                predicted_label = 1
-            elif answer.startswith('no'):
-                predicted_label = 0
-            else:
-                if 'yes' in answer and 'no' not in answer:
-                    predicted_label = 1
-                elif 'no' in answer and 'yes' not in answer:
-                    predicted_label = 0
-                else:
-                    predicted_label = 0
-
-            if predicted_label == true_label:
-                correct += 1
-            total += 1
-
-            if total % 10 == 0:
-                logger.info(f"    {total}/{min(len(data), 1000)}")
+            ],
+            'gold': {'label': item['label']},
+        })
+    return examples
+
+
+def run_benchmark(model: str, host: str, port: int, judge_host: str = None, judge_port: int = None, engine: Engine = None, journal: Journal = None, sampler: Sampler = None, scoring: str = 'generate') -> float:
+    if scoring not in ('generate', 'logprobs'):
+        raise ValueError(f"Unknown StorySumm scoring: {scoring}. Use 'generate' or 'logprobs'")
+
+    if engine is None:
+        with Engine() as engine:
+            return run_benchmark(model, host, port, judge_host, judge_port, engine=engine, journal=journal, sampler=sampler, scoring=scoring)
+    if journal is None:
+        journal = Journal()
+    sampler = sampler or Sampler()
+
+    examples = sampler.order(load_examples(), stratify=lambda example: example['gold']['label'])
+    ids = [example['id'] for example in examples]
+    pending = [example for example in examples if example['id'] not in journal]
+    requests = [
+        {
+            "model": model,
+            "messages": example['messages'],
+            "temperature": 0.0,
+            **(LOGPROB_PARAMS if scoring == 'logprobs' else {"max_tokens": 10})
+        }
+        for example in pending
+    ]
+
+    def on_result(index, response):
+        example = pending[index]
+        try:
+            if scoring == 'logprobs':
+                probabilities = option_probabilities(response, OPTIONS)
+                predicted = top_option(probabilities)
+                correct = predicted is not None and int(predicted == 'Yes') == example['gold']['label']
+                journal.record(example['id'], {'answer': predicted, 'probabilities': probabilities}, correct)
+                return
+            answer_text = message_content(response)
+            journal.record(example['id'], answer_text, score(example['gold'], answer_text))
         except Exception as e:
             logger.error(f"    Error: {e}")
-            continue
+
+    engine.complete(f"http://{host}:{port}/v1", requests, log_every=10, on_result=on_result, stop=sampler.stopper(journal, ids))
+
+    verdicts = journal.verdicts(ids)
+    correct = sum(verdicts)
+    total = len(verdicts)
 
     accuracy = correct / total if total > 0 else 0.0
     logger.info(f"    {total} examples, {correct} correct")
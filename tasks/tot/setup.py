@@ -1,21 +1,28 @@
 """Setup script for ToT benchmark"""
 
 import logging
+import shutil
 from pathlib import Path
 from datasets import load_dataset
 from datasets.utils.logging import disable_progress_bar
 
 disable_progress_bar()
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=logging.INFO, format='%(message)s')
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
 benchmark_dir = Path(__file__).parent
 original_repo_dir = benchmark_dir / "tot-original"
+original_repo_dir.mkdir(exist_ok=True)
 
-if not original_repo_dir.exists():
-    original_repo_dir.mkdir()
-
-    for config in ['tot_arithmetic', 'tot_semantic', 'tot_semantic_large']:
-        dataset = load_dataset("baharef/ToT", config)
-        dataset.save_to_disk(str(original_repo_dir / config))
-        logging.info(f"Done downloading {config}")
+# Each config is saved under a temporary name and renamed once complete, so an
+# interrupted setup resumes with the configs that are still missing.
+for config in ['tot_arithmetic', 'tot_semantic', 'tot_semantic_large']:
+    config_dir = original_repo_dir / config
+    if config_dir.exists():
+        continue
+    partial_dir = original_repo_dir / f"{config}.partial"
+    shutil.rmtree(partial_dir, ignore_errors=True)
+    dataset = load_dataset("baharef/ToT", config)
+    dataset.save_to_disk(str(partial_dir))
+    partial_dir.rename(config_dir)
+    logging.info(f"    tot: done downloading {config}")
@@ -1,66 +1,131 @@
+import json
 import logging
+import re
+from collections import Counter
 from pathlib import Path
-from openai import OpenAI
-from datasets import load_from_disk
+
+from narrabench.data import head
+from narrabench.engine import Engine, message_content
+from narrabench.journal import Journal
+from narrabench.prompts import precompiled
+from narrabench.sampling import Sampler
 
 logger = logging.getLogger(__name__)
 
+DATA_PATH = Path(__file__).parent / "tot-original" / "tot_semantic" / "test"
+
+EXPLANATION_CHARS = 200
+
+# Guided mode constrains decoding to this schema: the answer comes first and
+# the explanation is optional and capped, so the output budget can be small.
+ANSWER_SCHEMA = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "tot_answer",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "answer": {"type": "string", "pattern": "^E[0-9]+$"},
+                "explanation": {"type": "string", "maxLength": EXPLANATION_CHARS},
+            },
+            "required": ["answer"],
+            "additionalProperties": False,
+        },
+    },
+}
+
 
 def normalize_answer(answer: str) -> str:
     return answer.strip().upper()
 
 
-def run_benchmark(model: str, host: str, port: int, judge_host: str = None, judge_port: int = None) -> float:
-    data_path = Path(__file__).parent / "tot-original" / "tot_semantic" / "test"
-    if not data_path.exists():
-        raise FileNotFoundError(f"Data file not found: {data_path}")
-
-    ds = load_from_disk(str(data_path))
-    client = OpenAI(base_url=f"http://{host}:{port}/v1", api_key="dummy")
-
-    correct = 0
-    total = 0
-
-    for example in list(ds)[:1000]:
-        prompt = example['prompt']
-        question = example['question']
-        label = example['label']
-
+def parse_answer(answer_text: str) -> tuple:
+    """Return the predicted entity and how it was found: 'json', the 'regex' fallback, or 'none'."""
+    answer_text = answer_text.strip()
+
+    try:
+        answer = json.loads(answer_text).get('answer')
+    except (json.JSONDecodeError, AttributeError):
+        answer = None
+    if isinstance(answer, str) and re.fullmatch(r'E[0-9]+', normalize_answer(answer)):
+        return normalize_answer(answer), 'json'
+
+    match = re.search(r'E\d+', answer_text)
+    if match:
+        return normalize_answer(match.group(0)), 'regex'
+    return '', 'none'
+
+
+def score(example: dict, answer_text: str) -> bool:
+    predicted, _ = parse_answer(answer_text)
+    ground_truth = normalize_answer(example['label'])
+
+    return predicted == ground_truth or ground_truth in predicted
+
+
+@precompiled(DATA_PATH)
+def load_examples() -> list:
+    if not DATA_PATH.exists():
+        raise FileNotFoundError(f"Data file not found: {DATA_PATH}")
+
+    from datasets import load_from_disk
+
+    ds = load_from_disk(str(DATA_PATH))
+    rows = head(ds, 1000).select_columns(['prompt', 'label'])
+    return [
+        {
+            'id': str(i),
+            'messages': [
+                {"role": "system", "content": "You are a helpful assistant that answers temporal reasoning questions based on temporal facts. Output only a valid JSON string with two fields: 'explanation' and 'answer'. The answer field should contain the entity ID (e.g., E76)."},
+                {"role": "user", "content": row['prompt']}
+            ],
+            'gold': {'label': row['label']},
+        }
+        for i, row in enumerate(rows)
+    ]
+
+
+def run_benchmark(model: str, host: str, port: int, judge_host: str = None, judge_port: int = None, engine: Engine = None, journal: Journal = None, sampler: Sampler = None, mode: str = 'free') -> float:
+    if mode not in ('free', 'guided'):
+        raise ValueError(f"Unknown ToT mode: {mode}. Use 'free' or 'guided'")
+
+    if engine is None:
+        with Engine() as engine:
+            return run_benchmark(model, host, port, judge_host, judge_port, engine=engine, journal=journal, sampler=sampler, mode=mode)
+    if journal is None:
+        journal = Journal()
+    sampler = sampler or Sampler()
+
+    examples = sampler.order(load_examples())
+    ids = [example['id'] for example in examples]
+    pending = [example for example in examples if example['id'] not in journal]
+    requests = [
+        {
+            "model": model,
+            "messages": example['messages'],
+            "temperature": 0.0,
+            **({"response_format": ANSWER_SCHEMA, "max_tokens": 80} if mode == 'guided' else {"max_tokens": 200})
+        }
+        for example in pending
+    ]
+
+    def on_result(index, response):
+        example = pending[index]
         try:
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that answers temporal reasoning questions based on temporal facts. Output only a valid JSON string with two fields: 'explanation' and 'answer'. The answer field should contain the entity ID (e.g., E76)."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.0,
-                max_tokens=200
-            )
-
-            answer_text = response.choices[0].message.content.strip()
-
-            import json
-            import re
-            try:
-                parsed = json.loads(answer_text)
-                predicted = normalize_answer(parsed.get('answer', ''))
-            except:
-                match = re.search(r'E\d+', answer_text)
-                predicted = normalize_answer(match.group(0) if match else '')
-
-            ground_truth = normalize_answer(label)
-
-            if predicted == ground_truth or ground_truth in predicted:
-                correct += 1
-
-            total += 1
-
-            if total % 100 == 0:
-                logger.info(f"    {total}/{min(len(ds), 1000)}")
+            answer_text = message_content(response)
+            journal.record(example['id'], answer_text, score(example['gold'], answer_text))
         except Exception as e:
             logger.error(f"    Error: {e}")
-            continue
+
+    engine.complete(f"http://{host}:{port}/v1", requests, log_every=100, on_result=on_result, stop=sampler.stopper(journal, ids))
+
+    verdicts = journal.verdicts(ids)
+    correct = sum(verdicts)
+    total = len(verdicts)
 
     accuracy = correct / total if total > 0 else 0.0
-    logger.info(f"    {total} examples, {correct} correct")
+    paths = Counter(parse_answer(journal.records[i]['response'])[1] for i in ids if i in journal)
+    logger.info(f"    {total} examples, {correct} correct ({mode} mode)")
+    logger.info(f"    Parsed: {paths['json']} as JSON, {paths['regex']} by E-number fallback, {paths['none']} unparsed")
     return accuracy
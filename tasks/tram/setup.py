@@ -1,22 +1,15 @@
-import urllib.request
-import zipfile
-from pathlib import Path
+"""Setup script for TRAM benchmark"""
 
-benchmark_dir = Path(__file__).parent
-original_repo_dir = benchmark_dir / "tram-original"
+import logging
+from pathlib import Path
 
-if not original_repo_dir.exists():
-    zip_path = benchmark_dir / "tram.zip"
-    urllib.request.urlretrieve("https://github.com/EternityYW/TRAM-Benchmark/archive/refs/heads/main.zip", zip_path)
+from narrabench.fetch import extract, fetch_task
 
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(benchmark_dir)
+logging.basicConfig(level=logging.INFO, format='%(message)s')
 
-    (benchmark_dir / "TRAM-Benchmark-main").rename(original_repo_dir)
-    zip_path.unlink()
+original_repo_dir = fetch_task(Path(__file__).parent)
 
+# The question sets ship as zips inside the archive's datasets/ folder.
 datasets_dir = original_repo_dir / "datasets"
-if datasets_dir.exists():
-    for dataset_zip in datasets_dir.glob("*.zip"):
-        with zipfile.ZipFile(dataset_zip, 'r') as zf:
-            zf.extractall(datasets_dir)
+for dataset_zip in datasets_dir.glob("*.zip"):
+    extract(dataset_zip, datasets_dir)
@@ -1,66 +1,96 @@
-import csv
 import logging
 from pathlib import Path
-from openai import OpenAI
+
+from narrabench.data import read_delimited
+from narrabench.engine import LOGPROB_PARAMS, Engine, message_content, option_probabilities, top_option
+from narrabench.journal import Journal
+from narrabench.prompts import precompiled
+from narrabench.sampling import Sampler
 
 logger = logging.getLogger(__name__)
 
+DATA_PATH = Path(__file__).parent / "tram-original" / "datasets" / "ordering_mcq.csv"
+
+OPTIONS = ['A', 'B', 'C']
+
+
+def score(row: dict, answer_text: str) -> bool:
+    predicted = answer_text.strip().upper()
+
+    if predicted.startswith('A') or predicted == 'A':
+        predicted = 'A'
+    elif predicted.startswith('B') or predicted == 'B':
+        predicted = 'B'
+    elif predicted.startswith('C') or predicted == 'C':
+        predicted = 'C'
+    else:
+        predicted = predicted[0] if predicted else ''
 
-def run_benchmark(model: str, host: str, port: int, judge_host: str = None, judge_port: int = None) -> float:
-    data_path = Path(__file__).parent / "tram-original" / "datasets" / "ordering_mcq.csv"
-    if not data_path.exists():
-        raise FileNotFoundError(f"Data file not found: {data_path}. Run setup.py first.")
+    return predicted == row['Answer']
 
-    client = OpenAI(base_url=f"http://{host}:{port}/v1", api_key="dummy")
 
-    with open(data_path, 'r') as f:
-        reader = csv.DictReader(f)
-        data = list(reader)
+@precompiled(DATA_PATH)
+def load_examples() -> list:
+    if not DATA_PATH.exists():
+        raise FileNotFoundError(f"Data file not found: {DATA_PATH}. Run setup.py first.")
 
-    correct = 0
-    total = 0
+    examples = []
+    for i, row in enumerate(read_delimited(DATA_PATH, limit=1000)):
+        options_text = f"A. {row['Option A']}\nB. {row['Option B']}\nC. {row['Option C']}"
+        prompt = f"{row['Question']}\n\n{options_text}\n\nAnswer with only the letter (A, B, or C):"
+        examples.append({
+            'id': str(i),
+            'messages': [
+                {"role": "system", "content": "You are a helpful assistant. Answer multiple choice questions by providing only the letter of the correct answer."},
+                {"role": "user", "content": prompt}
+            ],
+            'gold': {'Answer': row['Answer']},
+        })
+    return examples
 
-    for row in data[:1000]:
-        question = row['Question']
-        option_a = row['Option A']
-        option_b = row['Option B']
-        option_c = row['Option C']
-        answer = row['Answer']
 
-        options_text = f"A. {option_a}\nB. {option_b}\nC. {option_c}"
-        prompt = f"{question}\n\n{options_text}\n\nAnswer with only the letter (A, B, or C):"
+def run_benchmark(model: str, host: str, port: int, judge_host: str = None, judge_port: int = None, engine: Engine = None, journal: Journal = None, sampler: Sampler = None, scoring: str = 'generate') -> float:
+    if scoring not in ('generate', 'logprobs'):
+        raise ValueError(f"Unknown TRAM scoring: {scoring}. Use 'generate' or 'logprobs'")
 
+    if engine is None:
+        with Engine() as engine:
+            return run_benchmark(model, host, port, judge_host, judge_port, engine=engine, journal=journal, sampler=sampler, scoring=scoring)
+    if journal is None:
+        journal = Journal()
+    sampler = sampler or Sampler()
+
+    examples = sampler.order(load_examples())
+    ids = [example['id'] for example in examples]
+    pending = [example for example in examples if example['id'] not in journal]
+    requests = [
+        {
+            "model": model,
+            "messages": example['messages'],
+            "temperature": 0.0,
+            **(LOGPROB_PARAMS if scoring == 'logprobs' else {"max_tokens": 10})
+        }
+        for example in pending
+    ]
+
+    def on_result(index, response):
+        example = pending[index]
         try:
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant. Answer multiple choice questions by providing only the letter of the correct answer."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.0,
-                max_tokens=10
-            )
-
-            predicted = response.choices[0].message.content.strip().upper()
-
-            if predicted.startswith('A') or predicted == 'A':
-                predicted = 'A'
-            elif predicted.startswith('B') or predicted == 'B':
-                predicted = 'B'
-            elif predicted.startswith('C') or predicted == 'C':
-                predicted = 'C'
-            else:
-                predicted = predicted[0] if predicted else ''
-
-            if predicted == answer:
-                correct += 1
-            total += 1
-
-            if total % 100 == 0:
-                logger.info(f"    {total}/{min(len(data), 1000)}")
+            if scoring == 'logprobs':
+                probabilities = option_probabilities(response, OPTIONS)
+                predicted = top_option(probabilities)
+                journal.record(example['id'], {'answer': predicted, 'probabilities': probabilities}, predicted == example['gold']['Answer'])
+                return
+            answer_text = message_content(response)
+            journal.record(example['id'], answer_text, score(example['gold'], answer_text))
         except Exception as e:
             logger.error(f"    Error: {e}")
-            continue
+
+    engine.complete(f"http://{host}:{port}/v1", requests, log_every=100, on_result=on_result, stop=sampler.stopper(journal, ids))
+
+    verdicts = journal.verdicts(ids)
+    correct = sum(verdicts)
+    total = len(verdicts)
 
     accuracy = correct / total if total > 0 else 0.0
     logger.info(f"    {total} examples, {correct} correct")
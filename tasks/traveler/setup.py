@@ -1,18 +1,10 @@
 """Setup script for TRaVelER benchmark"""
 
-import urllib.request
-import zipfile
+import logging
 from pathlib import Path
 
-benchmark_dir = Path(__file__).parent
-original_repo_dir = benchmark_dir / "traveler-original"
+from narrabench.fetch import fetch_task
 
-if not original_repo_dir.exists():
-    zip_path = benchmark_dir / "traveler.zip"
-    urllib.request.urlretrieve("https://gitlab.ub.uni-bielefeld.de/s.kenneweg/TRaVelER/-/archive/main/TRaVelER-main.zip", zip_path)
+logging.basicConfig(level=logging.INFO, format='%(message)s')
 
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(benchmark_dir)
-
-    (benchmark_dir / "TRaVelER-main").rename(original_repo_dir)
-    zip_path.unlink()
+fetch_task(Path(__file__).parent)
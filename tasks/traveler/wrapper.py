@@ -1,11 +1,23 @@
-import json
 import logging
+from datetime import datetime
 from pathlib import Path
-from openai import OpenAI
 import re
 
+from narrabench.data import read_json
+from narrabench.engine import Engine, message_content
+from narrabench.journal import Journal
+from narrabench.prompts import precompiled
+from narrabench.sampling import Sampler
+
 logger = logging.getLogger(__name__)
 
+DATASET_DIR = Path(__file__).parent / "traveler-original" / "dataset"
+EVENTS_DIR = Path(__file__).parent / "traveler-original" / "events"
+
+# Question set (relative to DATASET_DIR) and event log (in EVENTS_DIR) used by default.
+QUESTIONS = "explicit/5Events"
+EVENTS = "100Events"
+
 
 def normalize_answer(answer: str) -> str:
     answer = answer.lower().strip()
@@ -17,21 +29,16 @@ def normalize_answer(answer: str) -> str:
     return answer
 
 
-def evaluate_qa(question: str, ground_truth: str, events_context: str, client: OpenAI, model: str) -> bool:
-    messages = [
+def build_messages(question: str, events_context: str) -> list:
+    return [
         {"role": "system", "content": f"You are a helpful assistant that answers questions about events based on this event log:\n\n{events_context}\n\nProvide concise, direct answers."},
         {"role": "user", "content": question}
     ]
 
+
+def evaluate_qa(answer_text: str, ground_truth: str) -> bool:
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=0.0,
-            max_tokens=50
-        )
-
-        predicted = normalize_answer(response.choices[0].message.content.strip())
+        predicted = normalize_answer(answer_text.strip())
         gt = normalize_answer(ground_truth)
 
         if gt == "":
@@ -53,44 +60,82 @@ def evaluate_qa(question: str, ground_truth: str, events_context: str, client: O
         return False
 
 
-def run_benchmark(model: str, host: str, port: int, judge_host: str = None, judge_port: int = None) -> float:
-    data_path = Path(__file__).parent / "traveler-original" / "dataset" / "explicit" / "5Events.json"
-    events_path = Path(__file__).parent / "traveler-original" / "events" / "100Events.json"
+def log_size(name: str) -> int:
+    """Number of events in a log named like `100Events`, for ordering; 0 if the name has none."""
+    match = re.match(r'\d+', name)
+    return int(match.group(0)) if match else 0
+
+
+def variants() -> list:
+    """Every question set on disk paired with every event log, smallest log first, for `run.py --sweep`."""
+    question_sets = sorted(str(path.relative_to(DATASET_DIR).with_suffix('')) for path in DATASET_DIR.glob("*/*.json"))
+    logs = sorted((path.stem for path in EVENTS_DIR.glob("*.json")), key=lambda name: (log_size(name), name))
+    return [{'questions': questions, 'events': events} for questions in question_sets for events in logs]
+
 
+@precompiled(DATASET_DIR, EVENTS_DIR)
+def load_examples(questions: str = QUESTIONS, events: str = EVENTS) -> list:
+    data_path = DATASET_DIR / f"{questions}.json"
+    events_path = EVENTS_DIR / f"{events}.json"
     if not data_path.exists():
         raise FileNotFoundError(f"Data file not found: {data_path}")
     if not events_path.exists():
         raise FileNotFoundError(f"Events file not found: {events_path}")
 
-    client = OpenAI(base_url=f"http://{host}:{port}/v1", api_key="dummy")
+    items = read_json(data_path, limit=1000)
+    log = read_json(events_path)
 
-    with open(data_path, 'r') as f:
-        data = json.load(f)
-
-    with open(events_path, 'r') as f:
-        events = json.load(f)
-
-    from datetime import datetime
     events_text = "\n".join([
         f"- {e['Subject']} {e['Action']} {e['Object']} in the {e['Location']} on {datetime.fromtimestamp(e['Timestamp']).strftime('%Y-%m-%d')}"
-        for e in events
+        for e in log
     ])
 
-    correct = 0
-    total = 0
+    return [
+        {'id': str(i), 'messages': build_messages(item['text'], events_text), 'gold': item['gt_answers']}
+        for i, item in enumerate(items)
+    ]
+
+
+def run_benchmark(model: str, host: str, port: int, judge_host: str = None, judge_port: int = None, engine: Engine = None, journal: Journal = None, sampler: Sampler = None, questions: str = QUESTIONS, events: str = EVENTS) -> float:
+    if engine is None:
+        with Engine() as engine:
+            return run_benchmark(model, host, port, judge_host, judge_port, engine=engine, journal=journal, sampler=sampler, questions=questions, events=events)
+    if journal is None:
+        journal = Journal()
+    sampler = sampler or Sampler()
+
+    examples = sampler.order(load_examples(questions, events))
+    ids = [example['id'] for example in examples]
+    pending = [example for example in examples if example['id'] not in journal]
+    requests = [
+        {
+            "model": model,
+            "messages": example['messages'],
+            "temperature": 0.0,
+            "max_tokens": 50
+        }
+        for example in pending
+    ]
+    failed = 0
 
-    for item in data[:1000]:
-        question = item['text']
-        ground_truth = item['gt_answers']
+    def on_result(index, response):
+        nonlocal failed
+        example = pending[index]
+        try:
+            answer_text = message_content(response)
+        except Exception:
+            failed += 1
+            return
+        journal.record(example['id'], answer_text, evaluate_qa(answer_text, example['gold']))
 
-        is_correct = evaluate_qa(question, ground_truth, events_text, client, model)
-        if is_correct:
-            correct += 1
-        total += 1
+    engine.complete(f"http://{host}:{port}/v1", requests, log_every=20, on_result=on_result, stop=sampler.stopper(journal, ids))
 
-        if total % 20 == 0:
-            logger.info(f"    {total}/{min(len(data), 1000)}")
+    verdicts = journal.verdicts(ids)
+    correct = sum(verdicts)
+    total = len(verdicts)
 
     accuracy = correct / total if total > 0 else 0.0
-    logger.info(f"    {total} examples, {correct} correct")
+    logger.info(f"    {total} examples, {correct} correct ({questions} with the {events} log)")
+    if failed:
+        logger.info(f"    {failed} failed request(s), not counted in accuracy")
     return accuracy
@@ -0,0 +1,27 @@
+import json
+
+import pytest
+
+from narrabench.data import read_json, stream_json
+
+
+@pytest.mark.parametrize('chunk_size', range(1, 24))
+def test_stream_json_numbers_across_chunks(tmp_path, chunk_size):
+    values = [1.5, 2.25e3, -17, 0.125, 3E-2, 40, True, None, "1.5e3", {"x": 12.75}]
+    path = tmp_path / 'array.json'
+    path.write_text(json.dumps(values))
+    assert list(stream_json(path, chunk_size)) == values
+
+
+@pytest.mark.parametrize('chunk_size', range(1, 16))
+def test_stream_json_object_across_chunks(tmp_path, chunk_size):
+    members = {"a": 1.25, "b": [10, 2e-3], "c": -300}
+    path = tmp_path / 'object.json'
+    path.write_text(json.dumps(members))
+    assert list(stream_json(path, chunk_size)) == list(members.items())
+
+
+def test_read_json_limit(tmp_path):
+    path = tmp_path / 'array.json'
+    path.write_text("[1.5, 2.25e3, 3]")
+    assert read_json(path, 2) == [1.5, 2250.0]